@@ -0,0 +1,326 @@
+"""
+Animate maps across a swept third parameter.
+
+Frames come from a `cube.Cube` (or a stack of studies or archives merged
+into one) and are laid out by `Study.plot` on the first frame:
+
+    animate(Cube.load('i_en_an.cube'), 'i', 'inclination.gif', vars='ae')
+
+Each frame is composed of two layers:
+
+* the map itself, filled in with NumPy from the cell values through the
+  pixel-to-cell index of the plot axes, and the colour bar gradient;
+* an overlay with everything else (axes, labels, legend, frame title),
+  rendered by matplotlib with transparent holes for the map and colour
+  bar.  Workers of a process pool each stream a share of the frames
+  through one figure, updating only the title text in place.
+
+Overlays do not depend on the colour map, so they are cached in `cache`
+and re-encoding with another colour map or frame rate does not render
+any figure.  GIFs and PNG sequences are written with Pillow, other
+formats (e.g. `.mp4`) with ffmpeg if it is installed.
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import subprocess
+from pathlib import Path
+from multiprocessing import Pool
+
+import numpy as np
+
+from physconst import YR
+
+from cube import Cube
+from grid import Study, Fate, edges
+from render import agg
+
+VERSION = 10000
+
+
+def values(cube, data):
+    """
+    Cell values of `cube`: log time (yr), or fate with NaN if missing.
+    """
+    missing = np.isnan(cube.time)
+    if data == 'time':
+        return np.log10(np.maximum(cube.time / YR, 1))
+    if data == 'fate':
+        return np.where(missing, np.nan, cube.outcome)
+    raise AttributeError(f'Unknown data "{data}".')
+
+
+def frame_label(axis, x):
+    return Study.vars[axis][2].format(x)
+
+
+def figure(cube, axis, vars, data, dpi, clim):
+    """
+    Plot of the first frame with the map and colour bar made transparent.
+
+    Returns `(fig, ax, title, colorbar)`.
+    """
+    from matplotlib.image import AxesImage
+    from matplotlib.collections import QuadMesh, PathCollection
+
+    p = Study.vars[axis][0]
+    frame = cube.slice(**{p: cube.values[cube.axes.index(p)][0]})
+    study = frame.study()
+    fig = study.plot(vars, mode='fill', data=data)
+    fig.set_dpi(dpi)
+    ax = fig.axes[0]
+    for a, set_lim in zip(vars, (ax.set_xlim, ax.set_ylim)):
+        e = edges(cube.values[cube.axes.index(Study.vars[a][0])])
+        set_lim(e[0], e[-1])
+    mesh = [a for a in ax.get_children() if isinstance(a, (QuadMesh, AxesImage))][0]
+    colorbar = getattr(mesh, 'colorbar', None)
+    if data == 'fate':
+        # legend of all fates in the cube rather than of the first frame
+        for a in ax.get_children():
+            if isinstance(a, PathCollection):
+                a.remove()
+        ax.get_legend().remove()
+        fates = np.unique(cube.outcome[~np.isnan(cube.time)])
+        study.legend(ax, fates)
+    else:
+        mesh.set_clim(*clim)
+        colorbar.solids.set_visible(False)
+        colorbar.ax.patch.set_alpha(0)
+    mesh.set_visible(False)
+    ax.patch.set_alpha(0)
+    title = ax.set_title(frame_label(axis, frame.fixed[p]))
+    fig.tight_layout()
+    return fig, ax, title, colorbar
+
+
+def layout(fig, ax, colorbar, x, y):
+    """
+    Pixel boxes of the map and colour bar, and the cell index of each
+    pixel column and row of the map (-1 outside the cells).
+    """
+    fig.canvas.draw()
+    height = int(round(fig.bbox.height))
+
+    def box(a):
+        x0, y0, x1, y1 = a.get_window_extent().extents
+        return int(round(x0)), height - int(round(y1)), int(round(x1)), height - int(round(y0))
+
+    b = box(ax)
+    inverse = ax.transData.inverted()
+    px = np.arange(b[0], b[2]) + 0.5
+    py = height - (np.arange(b[1], b[3]) + 0.5)
+    dx = inverse.transform(np.stack([px, np.full_like(px, py[0])], axis=-1))[:, 0]
+    dy = inverse.transform(np.stack([np.full_like(py, px[0]), py], axis=-1))[:, 1]
+    index = list()
+    for d, c in ((dx, x), (dy, y)):
+        e = edges(c)
+        i = np.searchsorted(e, d, side='right') - 1
+        i[(d < e[0]) | (d > e[-1])] = -1
+        index.append(i)
+    result = dict(map=b, ix=index[0], iy=index[1])
+    if colorbar is not None:
+        result['colorbar'] = box(colorbar.ax)
+    return result
+
+
+def _overlays(job):
+    """
+    Render the overlays of frames `ks` through one figure; runs in a pool.
+    """
+    cube, axis, vars, data, dpi, clim, ks, path = job
+    from matplotlib import pylab as plt
+    fig, ax, title, colorbar = figure(cube, axis, vars, data, dpi, clim)
+    xs = cube.values[cube.axes.index(Study.vars[axis][0])]
+    for k in ks:
+        title.set_text(frame_label(axis, xs[k]))
+        fig.savefig(path / f'{k:05d}.png', dpi=dpi, transparent=True)
+    plt.close(fig)
+    return ks
+
+
+def digest(cube, axis, vars, data, dpi):
+    h = hashlib.sha256()
+    h.update(json.dumps(dict(
+        version = VERSION,
+        axes = cube.axes,
+        fixed = cube.fixed,
+        axis = axis,
+        vars = vars,
+        data = data,
+        dpi = dpi,
+        )).encode())
+    for x in cube.values + [cube.outcome, cube.time]:
+        h.update(np.ascontiguousarray(x).tobytes())
+    return h.hexdigest()[:16]
+
+
+def colorize(v, data, cmap, clim):
+    """
+    RGB (0-255) of cell values `v`; NaN is white.
+    """
+    rgb = np.ones(v.shape + (3,))
+    ok = ~np.isnan(v)
+    if data == 'fate':
+        rgb[ok] = Fate.colarr[v[ok].astype(np.int64)]
+    else:
+        rgb[ok] = cmap(np.clip((v[ok] - clim[0]) / (clim[1] - clim[0]), 0, 1))[:, :3]
+    return (rgb * 255).round().astype(np.uint8)
+
+
+def compose(overlay, v, geometry, data, cmap, clim):
+    """
+    Fill the map and colour bar into the transparent holes of `overlay`.
+    """
+    image = np.full(overlay.shape[:2] + (3,), 255, dtype=np.uint8)
+    x0, y0, x1, y1 = geometry['map']
+    ix, iy = geometry['ix'], geometry['iy']
+    cells = colorize(v, data, cmap, clim)
+    block = cells[np.maximum(ix, 0)[np.newaxis, :], np.maximum(iy, 0)[:, np.newaxis]]
+    block[(iy[:, np.newaxis] < 0) | (ix[np.newaxis, :] < 0)] = 255
+    image[y0:y1, x0:x1] = block
+    if 'colorbar' in geometry:
+        c0, r0, c1, r1 = geometry['colorbar']
+        level = np.linspace(clim[1], clim[0], r1 - r0)
+        image[r0:r1, c0:c1] = colorize(level, data, cmap, clim)[:, np.newaxis, :]
+    alpha = overlay[..., 3:4] / 255
+    return (overlay[..., :3] * alpha + image * (1 - alpha)).round().astype(np.uint8)
+
+
+def encode(frames, output, fps):
+    """
+    Write RGB `frames` as GIF, PNG sequence (directory) or via ffmpeg.
+    """
+    from PIL import Image
+    output = Path(output)
+    if output.suffix == '':
+        output.mkdir(parents=True, exist_ok=True)
+        for k, f in enumerate(frames):
+            Image.fromarray(f).save(output / f'frame_{k:05d}.png')
+    elif output.suffix == '.gif':
+        images = [Image.fromarray(f) for f in frames]
+        images[0].save(
+            output, save_all=True, append_images=images[1:],
+            duration=int(round(1000 / fps)), loop=0)
+    else:
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError(f'ffmpeg not found, cannot write {output.suffix}; use .gif or a directory.')
+        h, w = frames[0].shape[:2]
+        process = subprocess.Popen([
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{w}x{h}', '-r', str(fps), '-i', '-',
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2:color=white', '-pix_fmt', 'yuv420p',
+            str(output)], stdin=subprocess.PIPE)
+        for f in frames:
+            process.stdin.write(np.ascontiguousarray(f).tobytes())
+        process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError(f'ffmpeg failed writing {output}')
+    return output
+
+
+def animate(
+        cube,
+        axis,
+        output,
+        vars=None,
+        data='fate',
+        cmap=None,
+        fps=4,
+        dpi=100,
+        nparallel=None,
+        cache='animate.cache',
+        ):
+    """
+    Animate the maps of `cube` over the `Study.vars` key `axis`.
+
+    `cube` may also be a list of studies, archives or stores.  `cmap`
+    defaults to the colour map of `Study.plot`.
+    """
+    from PIL import Image
+    from matplotlib import colormaps
+    from matplotlib import pylab as plt
+    from color import ColorBlindRainbow
+
+    if not isinstance(cube, Cube):
+        if all(isinstance(c, Study) for c in cube):
+            cube = Cube.from_studies(cube)
+        else:
+            cube = Cube.from_files(cube)
+    p = Study.vars[axis][0]
+    if vars is None:
+        vars = ''.join(k for k in cube.vars() if k != axis)
+    assert len(cube.axes) == 3 and p in cube.axes, f'Need a 3D cube over {p}, got {cube.axes}.'
+    if cmap is None:
+        cmap = ColorBlindRainbow()
+    elif isinstance(cmap, str):
+        cmap = colormaps[cmap]
+
+    v = np.moveaxis(values(cube, data), cube.axes.index(p), 0)
+    rest = [a for a in cube.axes if a != p]
+    if rest != [Study.vars[k][0] for k in vars]:
+        v = v.swapaxes(1, 2)
+    clim = (0., float(np.nanmax(v))) if data == 'time' else (0., 1.)
+    x, y = [cube.values[cube.axes.index(Study.vars[k][0])] for k in vars]
+
+    path = Path(cache) / digest(cube, axis, vars, data, dpi)
+    path.mkdir(parents=True, exist_ok=True)
+    n = len(v)
+    todo = [k for k in range(n) if not (path / f'{k:05d}.png').exists()]
+    geometry = path / 'layout.npz'
+    if not geometry.exists():
+        fig, ax, _, colorbar = figure(cube, axis, vars, data, dpi, clim)
+        np.savez(geometry, **layout(fig, ax, colorbar, x, y))
+        plt.close(fig)
+    geometry = dict(np.load(geometry))
+    if len(todo) > 0:
+        print(f' [animate] rendering {len(todo)} of {n} overlays')
+        if nparallel is None:
+            nparallel = os.cpu_count()
+        nparallel = min(nparallel, len(todo))
+        jobs = [
+            (cube, axis, vars, data, dpi, clim, todo[j::nparallel], path)
+            for j in range(nparallel)]
+        if nparallel == 1:
+            list(map(_overlays, jobs))
+        else:
+            with Pool(nparallel, initializer=agg) as pool:
+                pool.map(_overlays, jobs, chunksize=1)
+
+    frames = [
+        compose(np.asarray(Image.open(path / f'{k:05d}.png').convert('RGBA')), v[k], geometry, data, cmap, clim)
+        for k in range(n)]
+    output = encode(frames, output, fps)
+    print(f' [animate] {n} frames -> {output}')
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Animate maps over a third parameter')
+    parser.add_argument('axis', help='key of Study.vars to animate over, e.g. i')
+    parser.add_argument('output', help='.gif, directory for PNGs, or e.g. .mp4 (ffmpeg)')
+    parser.add_argument('sources', nargs='+', help='cube directory, or archives and stores')
+    parser.add_argument('--vars', default=None, help='map axes, e.g. ae')
+    parser.add_argument('--data', default='fate')
+    parser.add_argument('--cmap', default=None)
+    parser.add_argument('--fps', type=float, default=4)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('-n', '--nparallel', type=int, default=None)
+    parser.add_argument('--cache', default='animate.cache')
+    args = parser.parse_args(argv)
+    agg()
+    if len(args.sources) == 1 and (Path(args.sources[0]) / 'cube.json').exists():
+        cube = Cube.load(args.sources[0])
+    else:
+        cube = args.sources
+    animate(
+        cube, args.axis, args.output, vars=args.vars, data=args.data, cmap=args.cmap,
+        fps=args.fps, dpi=args.dpi, nparallel=args.nparallel, cache=args.cache)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
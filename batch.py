@@ -0,0 +1,215 @@
+"""
+Batched point-mass integration of many grid points at once.
+
+`BatchQuad` resolves each grid point with `Quad.setup`, converts the
+orbits of the 2x2 hierarchy (earth-moon, star binary, and their outer
+orbit) to positions and velocities, and advances a whole block of points
+together in arrays of shape `(batch, bodies, 3)`.  Each member has its
+own adaptive time step and termination flag; finished members are
+dropped from the working arrays.
+
+The kernel is a kick-drift-kick leapfrog on point masses without spins
+or tides, so outcomes are marked `source='batch'`.  Use it to map large
+regions cheaply and `Quad` for the final word near boundaries.
+"""
+
+import numpy as np
+
+from physconst import AU, YR
+
+from quad import Quad, Outcome, Fate
+
+# cgs
+GRAV = 6.67430e-8
+MSUN = 1.98847e33
+RSUN = 6.957e10
+KM = 1.e5
+
+LENGTH = {'_AU': AU, '_km': KM, '_Rsun': RSUN, '_cm': 1.}
+MASS = {'_Msun': MSUN, '_kg': 1.e3, '_g': 1.}
+
+# bodies
+EARTH, MOON, STAR1, STAR2 = range(4)
+
+
+def quantity(config, key, units):
+    for suffix, unit in units.items():
+        try:
+            return config[key + suffix] * unit
+        except KeyError:
+            pass
+    raise KeyError(key)
+
+
+def rotation(i, O, w):
+    """
+    Rotation matrices `Rz(O) Rx(i) Rz(w)`, shape `(batch, 3, 3)`.
+    """
+    ci, si = np.cos(i), np.sin(i)
+    cO, sO = np.cos(O), np.sin(O)
+    cw, sw = np.cos(w), np.sin(w)
+    return np.stack([
+        np.stack([cO * cw - sO * ci * sw, -cO * sw - sO * ci * cw, sO * si], axis=-1),
+        np.stack([sO * cw + cO * ci * sw, -sO * sw + cO * ci * cw, -cO * si], axis=-1),
+        np.stack([si * sw, si * cw, ci], axis=-1),
+        ], axis=-2)
+
+
+def kepler(a, e, M, gm):
+    """
+    Relative position and velocity in the orbital plane, shape `(batch, 3)`.
+    """
+    E = M + e * np.sin(M)
+    for _ in range(50):
+        dE = (E - e * np.sin(E) - M) / (1 - e * np.cos(E))
+        E -= dE
+        if np.all(np.abs(dE) < 1.e-14):
+            break
+    cE, sE = np.cos(E), np.sin(E)
+    b = a * np.sqrt(1 - e**2)
+    Edot = np.sqrt(gm / a**3) / (1 - e * cE)
+    zero = np.zeros_like(a)
+    r = np.stack([a * (cE - e), b * sE, zero], axis=-1)
+    v = np.stack([-a * sE * Edot, b * cE * Edot, zero], axis=-1)
+    return r, v
+
+
+def orbits(configs, n, gm):
+    """
+    Relative states of orbit `binary.n` of all `configs`.
+    """
+    a = np.array([quantity(c, f'binary.{n}.an', LENGTH) for c in configs])
+    e = np.array([c[f'binary.{n}.en'] for c in configs])
+    M, i, O, w = [
+        np.deg2rad([c[f'binary.{n}.{k}'] for c in configs])
+        for k in ('phase', 'inclination_deg', 'ascending_deg', 'periapsis_deg')]
+    r, v = kepler(a, e, M, gm)
+    R = rotation(i, O, w)
+    return np.einsum('bij,bj->bi', R, r), np.einsum('bij,bj->bi', R, v), R
+
+
+def initial(configs):
+    """
+    Positions, velocities, `G*m` and radii of the four bodies.
+    """
+    m = np.array([
+        [quantity(c, f'star.{k}.M', MASS) for k in range(1, 5)]
+        for c in configs])
+    s = np.array([
+        [quantity(c, f'star.{k}.S', LENGTH) for k in range(1, 5)]
+        for c in configs])
+    gm = GRAV * m
+    ga = gm[:, EARTH] + gm[:, MOON]
+    gb = gm[:, STAR1] + gm[:, STAR2]
+    r3, v3, R3 = orbits(configs, 3, ga + gb)
+    ra, va, _ = orbits(configs, 1, ga)
+    rb, vb, _ = orbits(configs, 2, gb)
+    if all(c['angles'] == 'relative' for c in configs):
+        ra, va, rb, vb = [np.einsum('bij,bj->bi', R3, x) for x in (ra, va, rb, vb)]
+    fa = (gb / (ga + gb))[:, np.newaxis]
+    x = np.ndarray((len(configs), 4, 3))
+    v = np.ndarray((len(configs), 4, 3))
+    for y, ya, yb, y3 in ((x, ra, rb, r3), (v, va, vb, v3)):
+        ca = fa * y3
+        cb = (fa - 1) * y3
+        y[:, EARTH] = ca - (gm[:, MOON] / ga)[:, np.newaxis] * ya
+        y[:, MOON] = ca + (gm[:, EARTH] / ga)[:, np.newaxis] * ya
+        y[:, STAR1] = cb - (gm[:, STAR2] / gb)[:, np.newaxis] * yb
+        y[:, STAR2] = cb + (gm[:, STAR1] / gb)[:, np.newaxis] * yb
+    return x, v, gm, s
+
+
+def accelerate(x, gm):
+    """
+    Accelerations and squared pair distances (diagonal set to `inf`).
+    """
+    d = x[:, np.newaxis, :, :] - x[:, :, np.newaxis, :]
+    r2 = np.sum(d**2, axis=-1)
+    i = np.arange(x.shape[1])
+    r2[:, i, i] = np.inf
+    a = np.sum(d * (gm[:, np.newaxis, :] * r2**-1.5)[..., np.newaxis], axis=2)
+    return a, r2
+
+
+class BatchQuad(Quad):
+    """
+    Drop-in task for `dispatch` that integrates blocks of `size` points.
+
+    `eta` is the time step in units of the shortest pair dynamical time.
+    """
+    VERSION = 10000
+
+    def __init__(self, toml='binary_martin_base2.toml', size=256, eta=0.02):
+        super().__init__(toml)
+        self.size = size
+        self.eta = eta
+
+    def options(self):
+        return (self.eta,)
+
+    def __call__(self, en=0, an=0.1, i=0, q=1, pm=0, pb=0, dt=1*YR, cutoff=11*AU, state=None):
+        assert state is None
+        return self.batch([dict(en=en, an=an, i=i, q=q, pm=pm, pb=pb, dt=dt)])[0]
+
+    def batch(self, points):
+        configs = list()
+        dt = np.ndarray(len(points))
+        for j, p in enumerate(points):
+            p = dict(p)
+            dt[j] = p.pop('dt', 1*YR)
+            configs.append(self.setup(**p))
+        # orbits with `an <= 0` give non-finite states, which fail below
+        with np.errstate(invalid='ignore', divide='ignore'):
+            x, v, gm, s = initial(configs)
+        ss = (s[:, :, np.newaxis] + s[:, np.newaxis, :])**2
+        gg = gm[:, :, np.newaxis] + gm[:, np.newaxis, :]
+        fa = gm[:, [EARTH, MOON]] / np.sum(gm[:, [EARTH, MOON]], axis=1, keepdims=True)
+        fb = gm[:, [STAR1, STAR2]] / np.sum(gm[:, [STAR1, STAR2]], axis=1, keepdims=True)
+
+        n = len(points)
+        fate = np.full(n, Fate.STABLE)
+        time = dt.copy()
+        t = np.zeros(n)
+        # indices of live members into the full block
+        ids = np.arange(n)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            a, r2 = accelerate(x, gm)
+        while len(ids) > 0:
+            h = self.eta * np.sqrt(np.min(r2**1.5 / gg, axis=(1, 2)))
+            h = np.minimum(h, dt[ids] - t)
+            # members that cannot advance would never finish
+            fail = ~(np.all(np.isfinite(x), axis=(1, 2)) & np.all(np.isfinite(v), axis=(1, 2)) & (h > 0))
+            if np.any(fail):
+                fate[ids[fail]] = Fate.FAIL
+                time[ids[fail]] = t[fail]
+                live = ~fail
+                ids, t, x, v, a, r2, gm, gg, ss, fa, fb, h = [
+                    y[live] for y in (ids, t, x, v, a, r2, gm, gg, ss, fa, fb, h)]
+                continue
+            h = h[:, np.newaxis, np.newaxis]
+            v += 0.5 * h * a
+            x += h * v
+            a, r2 = accelerate(x, gm)
+            v += 0.5 * h * a
+            t += h[:, 0, 0]
+
+            ca = np.einsum('bk,bki->bi', fa, x[:, [EARTH, MOON]])
+            cb = np.einsum('bk,bki->bi', fb, x[:, [STAR1, STAR2]])
+            moon = r2[:, EARTH, MOON] > Quad.MOONGONE**2
+            earth = np.sum((ca - cb)**2, axis=-1) > Quad.EARTHGONE**2
+            collide = np.any(r2 < ss, axis=(1, 2))
+            done = t >= dt[ids] * (1 - 1.e-12)
+            for mask, f in ((done, Fate.STABLE), (earth, Fate.EARTHGONE), (moon, Fate.MOONGONE), (collide, Fate.COLLISION)):
+                fate[ids[mask]] = f
+            stop = moon | earth | collide
+            time[ids[stop]] = t[stop]
+            live = ~(stop | done)
+            if not np.all(live):
+                ids, t, x, v, a, r2, gm, gg, ss, fa, fb = [
+                    y[live] for y in (ids, t, x, v, a, r2, gm, gg, ss, fa, fb)]
+
+        outcomes = [Outcome(int(f), float(tt), source='batch') for f, tt in zip(fate, time)]
+        for o in outcomes:
+            print(f' [{self.__class__.__name__}] {o!s}')
+        return outcomes
@@ -0,0 +1,238 @@
+"""
+Benchmark suite of reference `Quad` cells and small map slices.
+
+Canonical cells are run one at a time in this process, the map slices
+(11x11 cuts of the standard 121x121 maps) through `Study.sweep`.  Each
+entry reports the wall time, cells per second, the mean per-phase
+timing of `Quad(profile=True)` and the peak RSS, and the whole run is
+saved as JSON so runs on one machine can be compared over time.  The
+start-up time and RSS of a fresh worker process unpickling the task are
+measured as well:
+
+    python bench.py -o bench.json
+    python bench.py -o new.json --compare bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import pickle
+import platform
+import argparse
+import resource
+import subprocess
+
+import numpy as np
+
+from physconst import YR
+
+from grid import Quad, Study, Fate
+
+VERSION = 10000
+
+# fixed cells, chosen from the 1 KYR archives
+CELLS = {
+    'stable': dict(an=0.2, en=0.1, dt=1000*YR),
+    'moon gone': dict(an=0.465, en=0.435, dt=1000*YR),
+    'collision': dict(an=0.57, en=0.21, dt=1000*YR),
+    'retrograde': dict(an=0.4, i=180, dt=1000*YR),
+    'high en': dict(an=0.1, en=0.9, dt=1000*YR),
+    }
+
+
+def maps(n=11):
+    x = np.linspace(0, 0.9, n)
+    return {
+        'an_en': dict(an=x, en=x, dt=1000*YR),
+        'q_en_an_0.4': dict(q=np.linspace(0.1, 0.9, n), en=x, an=0.4, dt=1000*YR),
+        'i_180_an': dict(i=np.linspace(0, 180, n), an=x, dt=1000*YR),
+        'pm_en_an_0.4': dict(pm=x, en=x, an=0.4, dt=1000*YR),
+        }
+
+
+def rss():
+    """
+    Peak resident set size of this process and its children (MB).
+    """
+    scale = 2**-20 if sys.platform == 'darwin' else 2**-10
+    return dict(
+        self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+        )
+
+
+def phases(outcomes):
+    """
+    Mean per-phase timing and counters of profiled `outcomes`.
+    """
+    profiles = [o.profile for o in outcomes if getattr(o, 'profile', None) is not None]
+    if len(profiles) == 0:
+        return None
+    return {k: float(np.mean([p[k] for p in profiles])) for k in profiles[0]}
+
+
+def fates(outcomes):
+    labels = [Fate.labels[o.outcome] for o in outcomes]
+    return {k: labels.count(k) for k in sorted(set(labels))}
+
+
+def entry(outcomes, wall):
+    return dict(
+        n = len(outcomes),
+        wall = wall,
+        rate = len(outcomes) / wall,
+        fates = fates(outcomes),
+        phases = phases(outcomes),
+        rss = rss(),
+        )
+
+
+# run by a fresh interpreter, as a spawned pool or cluster worker
+WORKER = """
+import sys, json, time, pickle, resource
+t = time.perf_counter()
+task = pickle.load(sys.stdin.buffer)
+t = time.perf_counter() - t
+print(json.dumps(dict(
+    unpickle = t,
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    matplotlib = 'matplotlib' in sys.modules,
+    )))
+"""
+
+
+def bench_worker(task, repeat=3):
+    """
+    Start-up time and peak RSS (MB) of a fresh process unpickling `task`.
+    """
+    scale = 2**-20 if sys.platform == 'darwin' else 2**-10
+    data = pickle.dumps(task)
+    env = dict(os.environ)
+    path = os.path.dirname(os.path.abspath(__file__))
+    env['PYTHONPATH'] = os.pathsep.join([path] + [p for p in sys.path if p])
+    runs = list()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, '-c', WORKER],
+            input=data, capture_output=True, check=True, env=env,
+            ).stdout
+        wall = time.perf_counter() - t0
+        runs.append(dict(json.loads(out), wall=wall))
+    return dict(
+        wall = min(r['wall'] for r in runs),
+        unpickle = min(r['unpickle'] for r in runs),
+        rss = min(r['rss'] for r in runs) * scale,
+        matplotlib = runs[0]['matplotlib'],
+        )
+
+
+def bench_cells(task, repeat=1):
+    results = dict()
+    for name, point in CELLS.items():
+        t0 = time.perf_counter()
+        outcomes = [task(**point) for _ in range(repeat)]
+        results[name] = entry(outcomes, time.perf_counter() - t0)
+    return results
+
+
+def bench_maps(task, nparallel=None, n=11):
+    results = dict()
+    for name, kwargs in maps(n).items():
+        t0 = time.perf_counter()
+        study = Study.sweep(task=task, nparallel=nparallel, **kwargs)
+        results[name] = entry(study.results.result(), time.perf_counter() - t0)
+    return results
+
+
+def revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(cells=True, maps=True, repeat=1, nparallel=None, n=11, **kwargs):
+    """
+    Run the suite with `Quad(profile=True, **kwargs)`, return a JSON-able dict.
+    """
+    task = Quad(profile=True, **kwargs)
+    result = dict(
+        version = VERSION,
+        host = socket.gethostname(),
+        platform = platform.platform(),
+        python = platform.python_version(),
+        numpy = np.__version__,
+        revision = revision(),
+        date = time.strftime('%Y-%m-%dT%H:%M:%S'),
+        options = dict(repeat=repeat, nparallel=nparallel, n=n, **kwargs),
+        )
+    result['worker'] = bench_worker(task)
+    if cells:
+        result['cells'] = bench_cells(task, repeat)
+    if maps:
+        result['maps'] = bench_maps(task, nparallel, n)
+    result['rss'] = rss()
+    return result
+
+
+def compare(new, old):
+    """
+    Print the cells/sec of `new` relative to `old`.
+    """
+    if new['host'] != old['host']:
+        print(f' [compare] different hosts: {new["host"]} vs. {old["host"]}')
+    print(f'{"":>24s} {"old":>10s} {"new":>10s} {"ratio":>8s}')
+    for group in ('cells', 'maps'):
+        for name, x in new.get(group, dict()).items():
+            y = old.get(group, dict()).get(name)
+            if y is None:
+                continue
+            print(f'{name:>24s} {y["rate"]:10.3f} {x["rate"]:10.3f} {x["rate"] / y["rate"]:8.3f}')
+    x, y = new.get('worker'), old.get('worker')
+    if x is not None and y is not None:
+        for k in ('wall', 'rss'):
+            print(f'{"worker " + k:>24s} {y[k]:10.3f} {x[k]:10.3f} {x[k] / y[k]:8.3f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Quad benchmark suite')
+    parser.add_argument('-o', '--output', default=None, help='JSON file for the results')
+    parser.add_argument('--compare', default=None, help='JSON file of an earlier run')
+    parser.add_argument('-n', '--nparallel', type=int, default=None)
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='runs of each cell')
+    parser.add_argument('--size', type=int, default=11, help='points per map axis')
+    parser.add_argument('--no-cells', dest='cells', action='store_false')
+    parser.add_argument('--no-maps', dest='maps', action='store_false')
+    parser.add_argument('--dtd', type=float, default=None, help='output interval (yr)')
+    args = parser.parse_args(argv)
+    kwargs = dict()
+    if args.dtd is not None:
+        kwargs['dtd'] = args.dtd * YR
+    result = run(
+        cells=args.cells, maps=args.maps, repeat=args.repeat,
+        nparallel=args.nparallel, n=args.size, **kwargs)
+    for group in ('cells', 'maps'):
+        for name, x in result.get(group, dict()).items():
+            print(f' [bench] {name:>16s} {x["n"]:5d} cells {x["wall"]:10.3f} s {x["rate"]:10.3f} cells/s')
+    w = result['worker']
+    print(
+        f' [bench] worker start {w["wall"]:.3f} s, unpickle {w["unpickle"]:.3f} s, '
+        f'RSS {w["rss"]:.1f} MB, matplotlib {"loaded" if w["matplotlib"] else "not loaded"}')
+    print(f' [bench] peak RSS {result["rss"]["self"]:.1f} MB, children {result["rss"]["children"]:.1f} MB')
+    if args.output is not None:
+        with open(args.output, 'wt') as f:
+            json.dump(result, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare, 'rt') as f:
+            compare(result, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
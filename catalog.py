@@ -0,0 +1,278 @@
+"""
+Catalog of the parameter ranges of many study archives.
+
+The parameter ranges of an archive are only encoded in its name, e.g.
+`121x121grid_i_180_en_0.3AU1KYR.xz`.  A catalog scans `.xz` archives and
+columnar stores once, in a process pool, and records for each study its
+axes, parameter ranges, `dt`, version and `Quad` config hash in
+`catalog.json`, and its cells in `catalog.npy` next to it:
+
+    python catalog.py -o catalog.json *.xz Old_data/*.xz -n 8
+    python catalog.py -o catalog.json --query an=0.4 en=0.2:0.3
+
+A scalar selects cells within `tol` of it, `lo:hi` a closed range.
+Queries pick the studies whose ranges overlap first and then read only
+their cells from the memory-mapped `catalog.npy`.  Rescans only read
+archives that changed.  Unset parameters are stored as their `Quad`
+defaults.
+"""
+
+import os
+import sys
+import json
+import pickle
+import hashlib
+import argparse
+from pathlib import Path
+from multiprocessing import Pool
+
+import numpy as np
+
+import store
+from store import PARAMS, DTYPE, ColumnResults
+from quad import Fate, DEFAULTS, unwrap
+from grid import Study
+
+VERSION = 10000
+
+
+def config_hash(task):
+    """
+    Hash of the config of the `Quad` in `task`.
+    """
+    task = unwrap(task)
+    if task is None:
+        return None
+    return hashlib.sha256(pickle.dumps(task.config, protocol=4)).hexdigest()
+
+
+def stat(filename):
+    """
+    Total size and latest modification time of an archive or store.
+    """
+    path = Path(filename)
+    files = sorted(path.iterdir()) if path.is_dir() else [path]
+    st = [f.stat() for f in files]
+    return sum(s.st_size for s in st), max(s.st_mtime for s in st)
+
+
+def interval(x, tol):
+    """
+    Closed interval of a query value `x` or `(lo, hi)`.
+    """
+    if np.ndim(x) == 0:
+        x = (x, x)
+    lo, hi = x
+    return lo - tol * max(1, abs(lo)), hi + tol * max(1, abs(hi))
+
+
+def _scan(filename):
+    """
+    Catalog entry and cells of one study; runs in a pool worker.
+    """
+    try:
+        if store.is_store(filename):
+            columns, meta = store.load(filename)
+            table = store.table(columns)
+            version = meta.get('study_version')
+            task = None
+        else:
+            study = store.read_archive(filename)
+            table = np.array(study.table)
+            version = getattr(study, 'version', None)
+            task = study.task
+    except Exception as error:
+        print(f' [catalog] {filename}: {error!r}')
+        return None, None
+    for p in PARAMS:
+        table[p][np.isnan(table[p])] = DEFAULTS[p]
+    ranges = dict()
+    for p in PARAMS:
+        v = np.unique(table[p])
+        ranges[p] = [float(v[0]), float(v[-1]), len(v)] if len(v) > 0 else None
+    labels, counts = np.unique(table['outcome'], return_counts=True)
+    size, mtime = stat(filename)
+    entry = dict(
+        file = str(filename),
+        size = size,
+        mtime = mtime,
+        n = len(table),
+        study = Study.__name__,
+        version = version,
+        task = None if task is None else task.__class__.__name__,
+        config = config_hash(task),
+        axes = [p for p in PARAMS if p != 'dt' and ranges[p] is not None and ranges[p][2] > 1],
+        dt = np.unique(table['dt']).tolist(),
+        ranges = ranges,
+        fates = {Fate.labels.get(int(k), str(k)): int(c) for k, c in zip(labels, counts)},
+        )
+    return entry, table
+
+
+class Catalog(object):
+    """
+    Index of studies in `path` (JSON) and their cells (`.npy` next to it).
+    """
+    def __init__(self, path='catalog.json'):
+        self.path = Path(path)
+        self.studies = list()
+        self.cells = np.ndarray(0, dtype=DTYPE)
+        if self.path.exists():
+            with open(self.path, 'rt') as f:
+                meta = json.load(f)
+            if meta['version'] > VERSION:
+                raise ValueError(f'Catalog version {meta["version"]} not supported.')
+            self.studies = meta['studies']
+            self.cells = np.load(self.cells_path, mmap_mode='r')
+
+    @property
+    def cells_path(self):
+        return self.path.with_suffix('.npy')
+
+    def __len__(self):
+        return len(self.studies)
+
+    def scan(self, filenames, nparallel=None, force=False):
+        """
+        Add or update the studies in `filenames`; unchanged studies are
+        not read again unless `force` is set.  Studies whose files are
+        gone are dropped.
+        """
+        known = {e['file']: e for e in self.studies if Path(e['file']).exists()}
+        todo = list()
+        for filename in map(str, filenames):
+            e = known.get(filename)
+            if force or e is None or list(stat(filename)) != [e['size'], e['mtime']]:
+                todo.append(filename)
+                known.pop(filename, None)
+        print(f' [{self.__class__.__name__}] scanning {len(todo)} studies, {len(known)} unchanged')
+        entries = list()
+        tables = list()
+        for e in known.values():
+            entries.append(e)
+            tables.append(np.array(self.cells[e['offset']:e['offset'] + e['n']]))
+        pool = None
+        try:
+            if nparallel == 1:
+                scanned = map(_scan, todo)
+            else:
+                pool = Pool(nparallel)
+                scanned = pool.imap(_scan, todo)
+            for e, table in scanned:
+                if e is None:
+                    continue
+                entries.append(e)
+                tables.append(table)
+        finally:
+            if pool is not None:
+                pool.terminate()
+        offset = 0
+        for e in entries:
+            e['offset'] = offset
+            offset += e['n']
+        self.studies = entries
+        self.cells = np.concatenate([np.ndarray(0, dtype=DTYPE)] + tables)
+        self.save()
+        return self
+
+    def save(self):
+        tmp = self.cells_path.with_suffix(f'.{os.getpid()}.tmp.npy')
+        np.save(tmp, self.cells)
+        os.replace(tmp, self.cells_path)
+        tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'wt') as f:
+            json.dump(dict(version=VERSION, studies=self.studies), f, indent=1)
+        os.replace(tmp, self.path)
+        self.cells = np.load(self.cells_path, mmap_mode='r')
+
+    def select(self, tol=1e-4, **ranges):
+        """
+        Studies whose ranges overlap all `ranges`, e.g. `an=0.4` or
+        `en=(0.2, 0.3)`.
+        """
+        for p in ranges:
+            if p not in PARAMS:
+                raise AttributeError(f'Not a parameter: {p}.')
+        selected = list()
+        for e in self.studies:
+            for p, x in ranges.items():
+                lo, hi = interval(x, tol)
+                r = e['ranges'][p]
+                if r is None or r[1] < lo or r[0] > hi:
+                    break
+            else:
+                selected.append(e)
+        return selected
+
+    def query(self, tol=1e-4, **ranges):
+        """
+        Cells of all studies within `ranges`, a structured array as
+        `Study.table` with an extra `study` column indexing `self.studies`.
+        """
+        dtype = np.dtype(DTYPE.descr + [('study', np.int32)])
+        found = [np.ndarray(0, dtype=dtype)]
+        index = {id(e): k for k, e in enumerate(self.studies)}
+        for e in self.select(tol, **ranges):
+            cells = self.cells[e['offset']:e['offset'] + e['n']]
+            mask = np.ones(len(cells), dtype=bool)
+            for p, x in ranges.items():
+                lo, hi = interval(x, tol)
+                mask &= (cells[p] >= lo) & (cells[p] <= hi)
+            t = np.ndarray(np.count_nonzero(mask), dtype=dtype)
+            for k in DTYPE.names:
+                t[k] = cells[k][mask]
+            t['study'] = index[id(e)]
+            found.append(t)
+        return np.concatenate(found)
+
+    def study(self, tol=1e-4, **ranges):
+        """
+        `Study` of the cells within `ranges`, e.g. to plot them.
+        """
+        cells = self.query(tol, **ranges)
+        columns = {k: cells[k] for k in store.COLUMNS}
+        return Study.from_results(ColumnResults(columns))
+
+
+def parse(query):
+    """
+    Parse `p=x` or `p=lo:hi` query terms.
+    """
+    ranges = dict()
+    for term in query:
+        p, x = term.split('=')
+        if ':' in x:
+            ranges[p] = tuple(float(y) for y in x.split(':'))
+        else:
+            ranges[p] = float(x)
+    return ranges
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Catalog of study archives')
+    parser.add_argument('filenames', nargs='*', help='.xz archives or columnar stores to scan')
+    parser.add_argument('-o', '--output', default='catalog.json')
+    parser.add_argument('-n', '--nparallel', type=int, default=None)
+    parser.add_argument('-q', '--query', nargs='+', default=None, help='terms p=x or p=lo:hi')
+    parser.add_argument('--tol', type=float, default=1e-4, help='relative tolerance of query values')
+    parser.add_argument('--force', action='store_true', help='rescan unchanged studies too')
+    args = parser.parse_args(argv)
+    catalog = Catalog(args.output)
+    if len(args.filenames) > 0:
+        catalog.scan(args.filenames, nparallel=args.nparallel, force=args.force)
+    if args.query is None:
+        for e in catalog.studies:
+            axes = ', '.join(f'{p}={e["ranges"][p][0]:g}..{e["ranges"][p][1]:g}' for p in e['axes'])
+            print(f' [catalog] {e["file"]}: {e["n"]} cells, {axes}')
+        return
+    cells = catalog.query(args.tol, **parse(args.query))
+    studies, counts = np.unique(cells['study'], return_counts=True)
+    for k, c in zip(studies, counts):
+        fates = np.unique(cells['outcome'][cells['study'] == k], return_counts=True)
+        fates = ', '.join(f'{Fate.labels.get(int(f), f)} {n}' for f, n in zip(*fates))
+        print(f' [catalog] {catalog.studies[k]["file"]}: {c} cells ({fates})')
+    print(f' [catalog] {len(cells)} cells in {len(studies)} studies')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
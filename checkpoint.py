@@ -0,0 +1,85 @@
+"""
+Append-only checkpointing of finished `Quad` outcomes.
+
+Wrap the task of a study, e.g.
+
+    Study(checkpoint='121x121grid_q_en.ckpt', q=..., en=..., dt=...)
+
+Every finished point is appended to a per-process file in the checkpoint
+directory; rerunning the same study returns the recorded outcomes and
+only integrates the points that are still missing.
+"""
+
+import os
+import pickle
+import socket
+from pathlib import Path
+
+SUFFIX = '.pickle'
+
+
+class Checkpoint(object):
+    """
+    Task wrapper that records outcomes keyed by `task.key(**kwargs)`.
+    """
+    def __init__(self, task, path):
+        self.task = task
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.done = self.read()
+        print(f' [{self.__class__.__name__}] {len(self.done)} points done in {self.path}')
+
+    def read(self):
+        done = dict()
+        for filename in sorted(self.path.glob('*' + SUFFIX)):
+            with open(filename, 'rb') as f:
+                while True:
+                    try:
+                        key, outcome = pickle.load(f)
+                    except EOFError:
+                        break
+                    except Exception:
+                        # truncated by a crash while writing
+                        break
+                    done[key] = outcome
+        return done
+
+    def append(self, key, outcome):
+        filename = self.path / f'{socket.gethostname()}-{os.getpid()}{SUFFIX}'
+        with open(filename, 'ab') as f:
+            pickle.dump((key, outcome), f)
+        self.done[key] = outcome
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def key(self, **kwargs):
+        return self.task.key(**kwargs)
+
+    def digest(self, **kwargs):
+        return self.task.digest(**kwargs)
+
+    def lookup(self, points):
+        outcomes = [self.done.get(self.key(**p), None) for p in points]
+        if hasattr(self.task, 'lookup'):
+            todo = [j for j, o in enumerate(outcomes) if o is None]
+            for j, o in zip(todo, self.task.lookup([points[j] for j in todo])):
+                outcomes[j] = o
+        return outcomes
+
+    def record(self, points, outcomes):
+        """
+        Record `outcomes` of `points` run elsewhere, e.g. on a cluster.
+        """
+        for p, o in zip(points, outcomes):
+            self.append(self.key(**p), o)
+        if hasattr(self.task, 'record'):
+            self.task.record(points, outcomes)
+
+    def __call__(self, **kwargs):
+        key = self.task.key(**kwargs)
+        outcome = self.done.get(key, None)
+        if outcome is None:
+            outcome = self.task(**kwargs)
+            self.append(key, outcome)
+        return outcome
@@ -0,0 +1,221 @@
+"""
+Run `Study` points on several machines through a coordinator.
+
+The coordinator holds the points and serves them one at a time to
+workers that connect over a socket (`multiprocessing.connection`).  A
+point is leased to a worker until its outcome comes back; it is issued
+again if the worker's connection drops or the lease exceeds `timeout`.
+The first outcome returned for a point wins.
+
+On the coordinating machine, e.g.
+
+    coordinator = Coordinator(('', 6502))    # all interfaces
+    study = Study.sweep(cluster=coordinator, en=..., an=..., dt=...)
+
+and on each worker machine (in a checkout of this repository)
+
+    python cluster.py host:6502 -n 8
+
+The shared secret is taken from the environment variable `GRID_AUTHKEY`,
+which must be set: outcomes are unpickled, so anyone who can connect
+can run code on the coordinator.  Without an explicit `address`, the
+coordinator only listens on localhost.
+
+Each call of `run` is a new generation: points and results are tagged
+with it, workers are sent the new task before its points, and results
+of earlier generations are dropped.
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import traceback
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+AUTHKEY = os.environ.get('GRID_AUTHKEY', '').encode() or None
+PORT = 6502
+
+
+class Coordinator(object):
+    """
+    Serve points of a task to remote workers and collect their outcomes.
+    """
+    def __init__(self, address=('localhost', PORT), authkey=AUTHKEY, timeout=None):
+        if authkey is None:
+            raise ValueError('Set GRID_AUTHKEY or pass an authkey.')
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.timeout = timeout
+        self.lock = threading.Condition()
+        self.task = None
+        # counts calls of `run`, so workers pick up each task once
+        self.generation = 0
+        thread = threading.Thread(target=self.accept, daemon=True)
+        thread.start()
+
+    def accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                # listener closed
+                break
+            except Exception:
+                # failed authentication or handshake
+                continue
+            thread = threading.Thread(target=self.serve, args=(conn,), daemon=True)
+            thread.start()
+
+    def serve(self, conn):
+        leased = set()
+        generation = 0
+        try:
+            name = conn.recv()
+            while True:
+                with self.lock:
+                    while self.task is None or self.generation == generation:
+                        self.lock.wait()
+                    task = self.task
+                    generation = self.generation
+                leased.clear()
+                conn.send(('task', generation, task))
+                while True:
+                    request = conn.recv()
+                    if request[0] == 'result':
+                        _, g, j, outcome = request
+                        self.finish(g, j, outcome)
+                        leased.discard(j)
+                        continue
+                    reply = self.lease(name, generation)
+                    if reply[0] == 'point':
+                        leased.add(reply[1])
+                    conn.send(reply)
+                    if reply[0] == 'done':
+                        break
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+            with self.lock:
+                for j in leased if generation == self.generation else ():
+                    if self.outcomes[j] is None:
+                        self.leases.pop(j, None)
+                        self.queue.append(j)
+                self.lock.notify_all()
+
+    def lease(self, name, generation):
+        with self.lock:
+            if self.task is None or self.remaining == 0 or generation != self.generation:
+                return ('done',)
+            # skip points reissued after a timeout that have since finished
+            while len(self.queue) > 0 and self.outcomes[self.queue[-1]] is not None:
+                self.queue.pop()
+            if len(self.queue) == 0:
+                return ('wait', 1.)
+            j = self.queue.pop()
+            self.leases[j] = (name, time.time())
+            return ('point', generation, j, self.points[j])
+
+    def finish(self, generation, j, outcome):
+        with self.lock:
+            if generation != self.generation or self.outcomes[j] is not None:
+                # late result of an earlier run, or of a reissued point
+                return
+            if isinstance(outcome, Exception):
+                self.error = outcome
+            self.outcomes[j] = outcome
+            self.leases.pop(j, None)
+            self.remaining -= 1
+            self.lock.notify_all()
+
+    def run(self, task, points):
+        """
+        Return the outcomes of `task(**point)` for all `points`.
+        """
+        with self.lock:
+            self.points = points
+            self.outcomes = [None] * len(points)
+            self.remaining = len(points)
+            self.queue = list(reversed(range(len(points))))
+            self.leases = dict()
+            self.error = None
+            self.task = task
+            self.generation += 1
+            self.lock.notify_all()
+            print(f' [{self.__class__.__name__}] serving {len(points)} points on {self.address}')
+            while self.remaining > 0 and self.error is None:
+                self.lock.wait(timeout=1.)
+                if self.timeout is None:
+                    continue
+                now = time.time()
+                for j, (name, t) in list(self.leases.items()):
+                    if now - t > self.timeout:
+                        print(f' [{self.__class__.__name__}] reissuing point {j} of {name}')
+                        self.leases[j] = (name, now)
+                        self.queue.append(j)
+            self.task = None
+            if self.error is not None:
+                raise self.error
+            return self.outcomes
+
+    def close(self):
+        self.listener.close()
+
+
+def work(address, authkey=AUTHKEY):
+    """
+    Worker loop: fetch points from the coordinator at `address` until done.
+    """
+    if authkey is None:
+        raise ValueError('Set GRID_AUTHKEY or pass an authkey.')
+    name = f'{socket.gethostname()}-{os.getpid()}'
+    conn = Client(address, authkey=authkey)
+    conn.send(name)
+    try:
+        while True:
+            message = conn.recv()
+            assert message[0] == 'task'
+            _, generation, task = message
+            while True:
+                conn.send(('get',))
+                reply = conn.recv()
+                if reply[0] == 'done':
+                    break
+                if reply[0] == 'wait':
+                    time.sleep(reply[1])
+                    continue
+                _, g, j, point = reply
+                assert g == generation
+                try:
+                    outcome = task(**point)
+                except Exception:
+                    outcome = RuntimeError(f'{name}: {traceback.format_exc()}')
+                conn.send(('result', generation, j, outcome))
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Study worker')
+    parser.add_argument('address', help='coordinator host:port')
+    parser.add_argument('-n', '--nparallel', type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+    host, port = args.address.rsplit(':', 1)
+    address = (host, int(port))
+    workers = [
+        multiprocessing.Process(target=work, args=(address,))
+        for _ in range(args.nparallel)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
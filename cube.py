@@ -0,0 +1,225 @@
+"""
+N-dimensional cube of `Study` outcomes over several swept parameters.
+
+Instead of one archive per value of a third parameter, e.g.
+`121x121grid_q_en_1KYR_an_0.1.xz` ... `an_0.6`, the studies are merged
+into one cube indexed by the sorted values of each swept parameter:
+
+    cube = Cube.from_files(glob('121x121grid_q_en_1KYR_an_*.xz'))
+    cube.save('q_en_an.cube')
+    cube = Cube.load('q_en_an.cube')
+    cube.plot('qe', an=0.4)
+    cube.plot_fraction('qe')    # fraction stable over `an`
+
+Cubes are saved as one `.npy` file per array and opened memory-mapped,
+so slices only read the cells they contain.  Cells not covered by any
+study have `time` NaN.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+from matplotlib import pylab as plt
+
+import store
+from store import ColumnResults, PARAMS
+from grid import Study, Fate, edges
+
+VERSION = 10000
+
+META = 'cube.json'
+
+# parameter name -> key of `Study.vars`
+KEYS = {v[0]: k for k, v in Study.vars.items()}
+
+
+class Cube(object):
+    """
+    Outcomes on the product grid of the `values` of parameters `axes`.
+
+    Parameters that are the same for all cells are kept in `fixed`.
+    """
+    def __init__(self, axes, values, outcome, time, fixed=None):
+        self.axes = tuple(axes)
+        self.values = [np.asarray(x) for x in values]
+        self.outcome = outcome
+        self.time = time
+        self.fixed = dict() if fixed is None else fixed
+        assert self.outcome.shape == self.shape
+        assert self.time.shape == self.shape
+
+    @property
+    def shape(self):
+        return tuple(len(x) for x in self.values)
+
+    def vars(self):
+        """
+        Axes as a string of `Study.vars` keys.
+        """
+        return ''.join(KEYS[a] for a in self.axes)
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        Build a cube from a structured array as `Study.table`.
+        """
+        axes = list()
+        values = list()
+        index = list()
+        fixed = dict()
+        for p in PARAMS:
+            x = table[p]
+            if np.all(np.isnan(x)):
+                continue
+            v, i = np.unique(x, return_inverse=True)
+            if len(v) == 1:
+                fixed[p] = float(v[0])
+                continue
+            axes.append(p)
+            values.append(v)
+            index.append(i)
+        shape = tuple(len(x) for x in values)
+        outcome = np.zeros(shape, dtype=store.COLUMNS['outcome'])
+        time = np.full(shape, np.nan)
+        outcome[tuple(index)] = table['outcome']
+        time[tuple(index)] = table['time']
+        return cls(axes, values, outcome, time, fixed)
+
+    @classmethod
+    def from_studies(cls, studies):
+        return cls.from_table(np.concatenate([s.table for s in studies]))
+
+    @classmethod
+    def from_files(cls, filenames):
+        """
+        Merge `.xz` archives and columnar stores into one cube.
+        """
+        studies = list()
+        for filename in filenames:
+            if store.is_store(filename):
+                studies.append(Study.from_store(filename))
+            else:
+                studies.append(store.read_archive(filename))
+        return cls.from_studies(studies)
+
+    def save(self, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / 'outcome.npy', self.outcome)
+        np.save(path / 'time.npy', self.time)
+        for a, x in zip(self.axes, self.values):
+            np.save(path / f'{a}.npy', x)
+        header = dict(
+            version = VERSION,
+            axes = self.axes,
+            fixed = self.fixed,
+            )
+        with open(path / META, 'wt') as f:
+            json.dump(header, f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        path = Path(path)
+        with open(path / META, 'rt') as f:
+            meta = json.load(f)
+        if meta['version'] > VERSION:
+            raise ValueError(f'Cube version {meta["version"]} not supported.')
+        return cls(
+            meta['axes'],
+            [np.load(path / f'{a}.npy') for a in meta['axes']],
+            np.load(path / 'outcome.npy', mmap_mode=mmap_mode),
+            np.load(path / 'time.npy', mmap_mode=mmap_mode),
+            meta['fixed'],
+            )
+
+    def slice(self, **values):
+        """
+        Sub-cube at the axis values closest to `values`, e.g. `an=0.4`.
+
+        Only views are taken, so memory-mapped data is not read.
+        """
+        index = list()
+        axes = list()
+        keep = list()
+        fixed = dict(self.fixed)
+        for a, x in zip(self.axes, self.values):
+            if a in values:
+                i = int(np.argmin(np.abs(x - values.pop(a))))
+                index.append(i)
+                fixed[a] = float(x[i])
+            else:
+                index.append(slice(None))
+                axes.append(a)
+                keep.append(x)
+        if len(values) > 0:
+            raise AttributeError(f'Not an axis: {", ".join(values)}.')
+        index = tuple(index)
+        return self.__class__(axes, keep, self.outcome[index], self.time[index], fixed)
+
+    def fraction(self, fate=Fate.STABLE, vars=None):
+        """
+        Fraction of covered cells with `fate` along the axes `vars`
+        (keys of `Study.vars`, default all), e.g. stability over `'m'`.
+        """
+        if vars is None:
+            vars = self.vars()
+        axis = tuple(self.axes.index(Study.vars[k][0]) for k in vars)
+        covered = ~np.isnan(self.time)
+        n = np.sum(covered, axis=axis)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sum(covered & (self.outcome == fate), axis=axis) / n
+
+    def study(self):
+        """
+        `Study` of the covered cells, e.g. to plot a 2D slice.
+        """
+        covered = ~np.isnan(self.time)
+        columns = store.empty(np.count_nonzero(covered))
+        grid = np.meshgrid(*self.values, indexing='ij')
+        for a, x in zip(self.axes, grid):
+            columns[a][:] = x[covered]
+        for p, x in self.fixed.items():
+            columns[p][:] = x
+        columns['outcome'][:] = self.outcome[covered]
+        columns['time'][:] = self.time[covered]
+        return Study.from_results(ColumnResults(columns))
+
+    def plot(self, vars=None, mode=None, data='fate', **values):
+        """
+        Plot the 2D slice at `values` with `Study.plot`.
+        """
+        cube = self.slice(**values)
+        if vars is None:
+            vars = cube.vars()
+        assert len(cube.axes) == 2, f'Slice has axes {cube.axes}.'
+        return cube.study().plot(vars, mode=mode, data=data)
+
+    def plot_fraction(self, vars, fate=Fate.STABLE, **values):
+        """
+        Plot the fraction of cells with `fate` over the axes not in `vars`.
+        """
+        cube = self.slice(**values)
+        axes = [Study.vars[k][0] for k in vars]
+        assert len(axes) == 2
+        other = ''.join(k for k in cube.vars() if k not in vars)
+        f = cube.fraction(fate, other)
+        if cube.axes.index(axes[0]) > cube.axes.index(axes[1]):
+            f = f.T
+        x, y = [cube.values[cube.axes.index(a)] for a in axes]
+
+        fig, ax = plt.subplots()
+        cm = ax.pcolormesh(edges(x), edges(y), f.T, vmin=0, vmax=1)
+        ax.set_xlabel(Study.vars[vars[0]][1], fontsize=16)
+        ax.set_ylabel(Study.vars[vars[1]][1], fontsize=16)
+        label = f'fraction {Fate.labels[fate]}'
+        if len(other) > 0:
+            label += ' over ' + ', '.join(Study.vars[k][0] for k in other)
+        fig.colorbar(cm, label=label)
+        fig.tight_layout()
+        return fig
+
+    def __str__(self):
+        axes = ', '.join(f'{a}={len(x)}' for a, x in zip(self.axes, self.values))
+        return f'{self.__class__.__name__}({axes})'
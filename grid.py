@@ -1,49 +1,31 @@
 
+import copy
+import itertools
+from statistics import NormalDist
+
 import numpy as np
-from  matplotlib import pylab as plt
 
 from physconst import AU, YR
 from rotation import deg2rad
-from color import rgb, ColorBlindRainbow
-from human import time2human
+from color import rgb
 
-from multistar.generic import multi
-from multistar.config import Config
 from multistar.parallel import ParallelProcessor
-from multistar.util import firsttrue
-
-from multistar.interface import STATUS_OK, STATUS_COLLIDE, STATUS_ESCAPE
 
 from multistar.grid.base import StudyBase, FateBase, OutcomeBase, SystemBase
 
+import quad
+# the simulation core; re-exported so that existing archives unpickle
+from quad import GOLDEN, Outcome, Summary, Quad, dispatch
 
+import store
+from store import ColumnResults, PARAMS
+from checkpoint import Checkpoint
+from cache import Cache
+import schedule
 
-GOLDEN = 0.5 * (1 + np.sqrt(5))
 
-class Fate(object):
-    FAIL = 0
-    STABLE = 1
-    COLLISION = 10
-    EARTHGONE = 20
-    MOONGONE = 21
-
-    labels = {
-        FAIL: 'fail',
-        STABLE: 'stable',
-        COLLISION: 'collision',
-        EARTHGONE: 'earth gone',
-        MOONGONE: 'moon gone',
-        }
-
-    keys = {v:k for k,v in labels.items()}
-
-    colors = {
-        FAIL : rgb('gray'),
-        STABLE: rgb('k'),
-        COLLISION: rgb('r'),
-        EARTHGONE: rgb('b'),
-        MOONGONE: rgb('y'),
-        }
+class Fate(quad.Fate):
+    colors = {k: rgb(c) for k, c in quad.Fate.colornames.items()}
 
     assert np.all(np.array(list(colors.keys())) >= 0)
 
@@ -51,121 +33,46 @@ class Fate(object):
     for i,v in colors.items():
         colarr[i,:] = v
 
-class Outcome(object):
-    VERSION = 10000
-
-    def __init__(self, outcome, time):
-        if isinstance(outcome, str):
-            outcome = Fate.keys[outcome]
-        self.outcome = outcome
-        self.time = time
-        self.version = self.VERSION
-
-    @property
-    def stable(self):
-        return self.outcome == Fate.STABLE
-
-    @property
-    def unstable(self):
-        return self.outcome != Fate.STABLE
-
-    def __str__(self):
-        return f'{Fate.labels[self.outcome]}: {time2human(self.time)}'
-
-    def __repr__(self):
-        return f'{self.__class__.__name__}({str(self)})'
-
-class Quad(object):
-
-    def __init__(self, toml='binary_martin_base2.toml'):
-        self.config = Config(toml)
-
-    def __call__(self, en=0, an=0.1, i=0, q=1, pm=0, pb=0, dt=1*YR, cutoff=11*AU):
-        config = self.config.copy()
-        if en is not None:
-            config['binary.2.en'] = en
-        if an is not None:
-            config['binary.2.an_AU'] = an
-        if i is not None:
-            config['binary.2.inclination_deg'] = i
-        if q is not None:
-            assert 0.1 <= q <= 1
-            m1, m2 = np.array([1, q]) / (1 + q)
-            config['star.3.M_Msun'] = m1
-            config['star.4.M_Msun'] = m2
-
-            # TODO - FIX: need to adjust radii properly - (DONE)
-        if m1 <= 0.5:
-            config['star.3.S_Rsun'] = m1**0.56
-        else:
-            config['star.3.S_Rsun'] = m1**0.79
-
-        if m2 <= 0.5:
-            config['star.4.S_Rsun'] = m2**0.56
-        else:
-            config['star.4.S_Rsun'] = m2**0.79
-
-        if pm is not None:
-            config['binary.1.phase'] = pm
-        if pb is not None:
-            config['binary.2.phase'] = pb
-        if cutoff is not None:
-            config.set('cutoff', cutoff)
-        self.cutoff = cutoff
-
-
-        m = multi(config)
-
-        tx = np.minimum(dt, 1000*YR)
-        tt = 0
-        while True:
-            m.rund(tx, dtd=0.1*YR)
-            tt += tx
-            outcome =  self.analyze(m, tt)
-            if outcome.unstable:
-                break
-            if np.allclose(tt, dt):
-                break
-            tx = np.minimum(dt - tt, tx * GOLDEN)
-
-        # for DEBUG only
-        self.m = m
-        self.config = config
 
-        print(f' [{self.__class__.__name__}] {outcome!s}')
-
-        return outcome
-
-    def analyze(self, m, dt):
-
-        # analize result
-
-        if not hasattr(m, 't'):
-            m.t = None
-        if m.t is None:
-            return Outcome(Fate.FAIL, 0)
-
-        #if not np.allclose(m.t[-1], dt):
-            # TODO - test what collided (use m.rn)
-         #   return Outcome(Fate.COLLISION, m.t[-1])
-
-        ro = m.ron
-        # TODO - test whether moon is further from earth than (solar) hill radius
-        #if ((ii := np.argmax(ro[0, :] > 0.01 * AU)) > 0):
-           # return Outcome(Fate.MOONGONE, m.t[ii])
-        # TODO - test whether moon and earth escaped jointly
-        #if ((ii := np.argmax(ro[2, :] > 2 * AU)) > 0):
-         #   return Outcome(Fate.EARTHGONE, m.t[ii] )
-
-        if (ii := firsttrue(ro[0, :] > 0.01 * AU)) >= 0:
-            return Outcome(Fate.MOONGONE, m.t[ii-1])
-        if (ii := firsttrue(ro[2, :] > 10 * AU)) >= 0:
-            return Outcome(Fate.EARTHGONE, m.t[ii-1])
-
-        if not np.allclose(m.t[-1], dt):
-            return Outcome(Fate.COLLISION, m.t[-1])
-
-        return Outcome(Fate.STABLE, m.t[-1])
+def product(kwargs):
+    """
+    Product grid of the array-valued `kwargs`.
+
+    Returns the axis values, the index tuple of each point and the
+    points as parameter dicts, with the scalar `kwargs` in each.
+    """
+    kwargs = dict(kwargs)
+    axes = [k for k, v in kwargs.items() if np.ndim(v) > 0]
+    values = [np.asarray(kwargs.pop(k)) for k in axes]
+    index = list(itertools.product(*[range(len(x)) for x in values]))
+    points = [
+        dict(kwargs, **{k: x[i] for k, x, i in zip(axes, values, ii)})
+        for ii in index]
+    return values, index, points
+
+
+def wilson(k, n, confidence=0.95):
+    """
+    Wilson score interval of `k` successes in `n` trials; `(0, 1)` if `n = 0`.
+    """
+    z = NormalDist().inv_cdf(0.5 + 0.5 * confidence)
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = k / n
+        d = 1 + z**2 / n
+        c = (p + z**2 / (2 * n)) / d
+        h = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / d
+    return np.where(n > 0, c - h, 0.), np.where(n > 0, c + h, 1.)
+
+
+def edges(cv):
+    """
+    Cell boundaries centred on the sorted unique values `cv`.
+    """
+    cc = np.ndarray(len(cv)+1)
+    cc[1:-1] = 0.5 * (cv[1:] + cv[:-1])
+    cc[[0,-1]] = 0.5 * (3 * cv[[0,-1]] - cv[[1,-2]])
+    return cc
 
 
 class Study(ParallelProcessor):
@@ -192,27 +99,478 @@ class Study(ParallelProcessor):
         leg = ax.legend(loc='best')
         leg.set_draggable(True)
 
-    def __init__(self, **kwargs):
+    def __init__(self, checkpoint=None, cache=None, cache_size=Cache.SIZE, **kwargs):
+        """
+        If `checkpoint` is a directory name, finished points are recorded
+        there as they complete and skipped when the study is rerun.
+
+        If `cache` is a directory name, outcomes are looked up in and added
+        to the content-addressed `Cache` shared by all studies.
+        """
         kwargs.setdefault('task', Quad())
+        if cache is not None:
+            kwargs['task'] = Cache(kwargs['task'], cache, cache_size)
+        if checkpoint is not None:
+            kwargs['task'] = Checkpoint(kwargs['task'], checkpoint)
         super().__init__(**kwargs)
 
-    def plot(self, vars=None, mode=None, data='fate'):
+    @classmethod
+    def from_results(cls, results, task=None):
+        self = cls.__new__(cls)
+        self.version = cls.VERSION
+        self.task = task
+        self.results = results
+        return self
+
+    @classmethod
+    def from_store(cls, path):
+        """
+        Open a columnar store (see `store.py`) without unpickling.
+        """
+        columns, meta = store.load(path)
+        self = cls.from_results(ColumnResults(columns))
+        self.meta = meta
+        return self
+
+    def to_store(self, path, **meta):
+        return store.save(self, path, **meta)
+
+    @classmethod
+    def sweep(cls, task=None, nparallel=None, reference=None, coarse=None, cluster=None, screen=None, surrogate=None, **kwargs):
+        """
+        Run the product grid of the array-valued `kwargs` through `dispatch`.
+
+        Unlike the `ParallelProcessor` constructor, this uses the lookup
+        and batch extensions of the task.
+
+        The cost of each point is predicted from the nearest point of the
+        `reference` study, or, if `coarse` is set, of a first pass over
+        every `coarse`-th value of each axis; points are then scheduled
+        most expensive first with work stealing (see `schedule.py`).
+
+        With a `cluster.Coordinator`, points are run by remote workers
+        instead (see `cluster.py`).
+
+        With a `screen.Screen`, points it classifies as sure-stable or
+        sure-unstable are not integrated, except for its audit sample.
+
+        With a `surrogate.Surrogate`, points whose archived neighbours all
+        agree are not integrated either, except for its audit sample; the
+        points integrated are added to its index.
+        """
+        if task is None:
+            task = Quad()
+        values, index, points = product(kwargs)
+        outcomes = [None] * len(points)
+        audit = list()
+        if screen is not None:
+            outcomes, audit = screen.classify(task, points)
+            screened = [outcomes[j] for j in audit]
+            for j in audit:
+                outcomes[j] = None
+        check = list()
+        if surrogate is not None:
+            todo = [j for j, o in enumerate(outcomes) if o is None and j not in audit]
+            predicted, check = surrogate.classify([points[j] for j in todo])
+            for j, o in zip(todo, predicted):
+                outcomes[j] = o
+            check = [todo[k] for k in check]
+            predicted = [outcomes[j] for j in check]
+            for j in check:
+                outcomes[j] = None
+        if coarse is not None:
+            first = [
+                j for j, ii in enumerate(index)
+                if outcomes[j] is None and
+                all(i % coarse == 0 or i == len(x) - 1 for i, x in zip(ii, values))]
+            for j, o in zip(first, dispatch(task, [points[j] for j in first], nparallel, cluster=cluster)):
+                outcomes[j] = o
+            reference = ColumnResults.from_points(
+                [points[j] for j in first],
+                [outcomes[j] for j in first],
+                )
+        todo = [j for j, o in enumerate(outcomes) if o is None]
+        cost = None
+        if reference is not None:
+            if not isinstance(reference, ColumnResults):
+                reference = ColumnResults.from_results(reference.results)
+            cost = schedule.predict(
+                [points[j] for j in todo],
+                store.table(reference.columns),
+                )
+        for j, o in zip(todo, dispatch(task, [points[j] for j in todo], nparallel, cost, cluster)):
+            outcomes[j] = o
+        if len(audit) > 0:
+            screen.report(screened, [outcomes[j] for j in audit])
+        if len(check) > 0:
+            surrogate.report(predicted, [outcomes[j] for j in check])
+        if surrogate is not None:
+            run = [j for j, o in enumerate(outcomes) if o.source is None]
+            surrogate.add(ColumnResults.from_points(
+                [points[j] for j in run],
+                [outcomes[j] for j in run],
+                ).columns)
+        return cls.from_results(ColumnResults.from_points(points, outcomes), task)
+
+    @classmethod
+    def twopass(cls, task=None, cheap=None, horizon=0.1, halo=1, nparallel=None, cluster=None, **kwargs):
+        """
+        Sweep the product grid of `kwargs` in two passes of different fidelity.
+
+        Pass one runs all points with the `cheap` task (default: a copy
+        of `task` with ten times its output interval) up to `horizon`
+        times their `dt`.  Pass two reruns with `task` and the full `dt`
+        the points that were stable in pass one, and those with a
+        different pass-one fate within `halo` steps along any axis.  The
+        other points keep their pass-one outcome, see `Outcome.fidelity`.
+        """
+        if task is None:
+            task = Quad()
+        if cheap is None:
+            cheap = copy.copy(quad.unwrap(task))
+            cheap.dtd *= 10
+        values, index, points = product(kwargs)
+        short = [dict(p, dt=horizon * p.get('dt', 1*YR)) for p in points]
+        outcomes = dispatch(cheap, short, nparallel, cluster=cluster)
+
+        fate = np.array([o.outcome for o in outcomes]).reshape([len(x) for x in values])
+        redo = fate == Fate.STABLE
+        for axis in range(fate.ndim):
+            for s in range(1, halo + 1):
+                hi = [slice(None)] * fate.ndim
+                lo = [slice(None)] * fate.ndim
+                hi[axis] = slice(s, None)
+                lo[axis] = slice(None, -s)
+                change = fate[tuple(hi)] != fate[tuple(lo)]
+                redo[tuple(hi)] |= change
+                redo[tuple(lo)] |= change
+        todo = np.flatnonzero(redo)
+        print(f' [{cls.__name__}] pass two: {len(todo)} of {len(points)} points')
+        for j, o in zip(todo, dispatch(task, [points[j] for j in todo], nparallel, cluster=cluster)):
+            outcomes[j] = o
+        return cls.from_results(ColumnResults.from_points(points, outcomes), task)
+
+    @classmethod
+    def ensemble(
+            cls,
+            task=None,
+            nparallel=None,
+            sample=('pm', 'pb'),
+            batch=8,
+            samples=64,
+            tol=0.1,
+            confidence=0.95,
+            budget=None,
+            seed=0,
+            cluster=None,
+            **kwargs,
+            ):
+        """
+        Phase-averaged stability of each cell of the product grid of `kwargs`.
+
+        Each cell is run with the parameters in `sample` drawn at random:
+        phases `pm`, `pb` uniformly in degrees, `i` isotropically.  Cells
+        get `batch` more samples per round until the `confidence` interval
+        of their probability to be stable lies within `tol` of 0 or 1, or
+        they reach `samples`.  With a total `budget` of runs, the cells
+        with the widest intervals are sampled first.
+
+        The study holds all runs; `probability` and `plot(data='probability')`
+        average them over the sampled parameters.
+        """
+        if task is None:
+            task = Quad()
+        values, index, cells = product(kwargs)
+        rng = np.random.default_rng(seed)
+
+        def draw():
+            p = dict()
+            for k in sample:
+                if k == 'i':
+                    p[k] = np.rad2deg(np.arccos(rng.uniform(-1, 1)))
+                else:
+                    p[k] = rng.uniform(0, 360)
+            return p
+
+        n = np.zeros(len(cells), dtype=np.int64)
+        k = np.zeros(len(cells), dtype=np.int64)
+        points = list()
+        outcomes = list()
+        while True:
+            lo, hi = wilson(k, n, confidence)
+            active = (n < samples) & (hi >= tol) & (lo <= 1 - tol)
+            todo = np.flatnonzero(active)
+            todo = todo[np.argsort(lo[todo] - hi[todo], kind='stable')]
+            new = [
+                (j, dict(cells[j], **draw()))
+                for j in todo
+                for _ in range(min(batch, samples - n[j]))]
+            if budget is not None:
+                new = new[:budget - len(points)]
+            if len(new) == 0:
+                break
+            print(f' [{cls.__name__}] {len(new)} runs for {len(todo)} uncertain of {len(cells)} cells')
+            for (j, p), o in zip(new, dispatch(task, [p for _, p in new], nparallel, cluster=cluster)):
+                n[j] += 1
+                k[j] += o.stable
+                points.append(p)
+                outcomes.append(o)
+        self = cls.from_results(ColumnResults.from_points(points, outcomes), task)
+        self.sampled = tuple(sample)
+        self.confidence = confidence
+        return self
+
+    def probability(self, vars=None, confidence=None):
+        """
+        Probability to be stable on the grid of the axes `vars`, averaged
+        over all other parameters, with its `confidence` interval.
+
+        Returns the axis values, the probability, the lower and upper
+        bounds of the interval, and the number of runs per cell.
+        """
+        if vars is None:
+            sampled = self.__dict__.get('sampled', ())
+            vars = ''.join(k for k in self.axes() if self.vars[k][0] not in sampled)
+        if confidence is None:
+            confidence = self.__dict__.get('confidence', 0.95)
+        table = self.table
+        cv, ii = zip(*[np.unique(table[self.vars[k][0]], return_inverse=True) for k in vars])
+        shape = tuple(len(x) for x in cv)
+        flat = np.ravel_multi_index(ii, shape)
+        n = np.bincount(flat, minlength=np.prod(shape)).reshape(shape)
+        k = np.bincount(flat, weights=table['outcome'] == Fate.STABLE, minlength=np.prod(shape)).reshape(shape)
+        lo, hi = wilson(k, n, confidence)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            p = k / n
+        return cv, p, lo, hi, n
+
+    @classmethod
+    def adaptive(cls, task=None, nparallel=None, coarse=8, fill=4, **kwargs):
+        """
+        Sample a 2D map by boundary refinement.
+
+        Exactly two of `kwargs` are arrays and define the target grid, the
+        others are passed to `task` unchanged.  The grid is first sampled
+        at about `coarse` cells per axis; cells whose outcomes at the
+        corners, edge midpoints and centre disagree, or that span more
+        than `fill` grid steps, are bisected until the target resolution
+        is reached.  Points inside uniform cells are not integrated but
+        get the common fate of the corners and a bilinearly interpolated
+        time, marked by `Outcome.source = 'adaptive'`.
+        """
+        if task is None:
+            task = Quad()
+        axes = [k for k, v in kwargs.items() if np.ndim(v) > 0]
+        assert len(axes) == 2
+        values = [np.asarray(kwargs.pop(k), dtype=np.float64) for k in axes]
+        shape = tuple(len(x) for x in values)
+
+        def point(i, j):
+            return dict(kwargs, **{axes[0]: values[0][i], axes[1]: values[1][j]})
+
+        corners = [
+            np.unique(np.linspace(0, n - 1, min(coarse, n - 1) + 1).round().astype(int))
+            for n in shape]
+        blocks = [
+            (i0, i1, j0, j1)
+            for i0, i1 in zip(corners[0][:-1], corners[0][1:])
+            for j0, j1 in zip(corners[1][:-1], corners[1][1:])]
+        def split(b):
+            i0, i1, j0, j1 = b
+            ii = (i0, (i0 + i1) // 2, i1) if i1 - i0 > 1 else (i0, i1)
+            jj = (j0, (j0 + j1) // 2, j1) if j1 - j0 > 1 else (j0, j1)
+            return ii, jj
+
+        done = dict()
+        uniform = list()
+        while len(blocks) > 0:
+            # corners, edge midpoints and centre of each block
+            todo = sorted({
+                ij
+                for b in blocks
+                for ij in itertools.product(*split(b))
+                if ij not in done})
+            for ij, o in zip(todo, dispatch(task, [point(*ij) for ij in todo], nparallel)):
+                done[ij] = o
+            refine = list()
+            for b in blocks:
+                ii, jj = split(b)
+                fates = {done[ij].outcome for ij in itertools.product(ii, jj)}
+                if len(fates) == 1 and max(b[1] - b[0], b[3] - b[2]) <= fill:
+                    uniform.append(b)
+                    continue
+                refine.extend(
+                    (ia, ib, ja, jb)
+                    for ia, ib in zip(ii[:-1], ii[1:])
+                    for ja, jb in zip(jj[:-1], jj[1:])
+                    if (ia, ib, ja, jb) != b)
+            blocks = refine
+
+        outcomes = dict(done)
+        for i0, i1, j0, j1 in uniform:
+            o00, o10, o01, o11 = [done[ij] for ij in ((i0, j0), (i1, j0), (i0, j1), (i1, j1))]
+            for i in range(i0, i1 + 1):
+                u = (i - i0) / (i1 - i0)
+                for j in range(j0, j1 + 1):
+                    if (i, j) in outcomes:
+                        continue
+                    v = (j - j0) / (j1 - j0)
+                    time = (
+                        (1 - u) * (1 - v) * o00.time + u * (1 - v) * o10.time +
+                        (1 - u) * v * o01.time + u * v * o11.time)
+                    outcomes[(i, j)] = Outcome(o00.outcome, time, source='adaptive')
+
+        ij = [(i, j) for i in range(shape[0]) for j in range(shape[1])]
+        print(f' [{cls.__name__}] adaptive: integrated {len(done)} of {len(ij)} points')
+        results = ColumnResults.from_points(
+            [point(*x) for x in ij],
+            [outcomes[x] for x in ij],
+            )
+        return cls.from_results(results, task)
+
+    def report(self, vars=None, bins=4):
+        """
+        Summarise the `Quad(profile=True)` timings by fate and by region.
+
+        The region is a `bins` x `bins` partition of the two `vars` axes
+        (default: the varying ones).  Returns the tables as dicts.
+        """
+        outcomes = self.results.result()
+        keep = [j for j, o in enumerate(outcomes) if getattr(o, 'profile', None) is not None]
+        if len(keep) == 0:
+            print(f' [{self.__class__.__name__}] no profiles, run with Quad(profile=True)')
+            return None
+        profiles = [outcomes[j].profile for j in keep]
+        t = np.array([[p[k] for k in Quad.PHASES] for p in profiles])
+        chunks = np.array([p['chunks'] for p in profiles])
+        samples = np.array([p['samples'] for p in profiles])
+        total = np.sum(t, axis=1)
+        table = self.table[keep]
+
+        def row(label, ii):
+            n = np.count_nonzero(ii)
+            mean = np.mean(t[ii], axis=0)
+            overhead = np.sum(t[ii, :2]) / np.sum(total[ii])
+            print(
+                f'{label:>24s} {n:7d} ' +
+                ' '.join(f'{x:10.4f}' for x in mean) +
+                f' {np.mean(chunks[ii]):7.2f} {np.mean(samples[ii]):9.0f} {overhead:8.2%}')
+            return dict(n=n, mean=dict(zip(Quad.PHASES, mean)), chunks=np.mean(chunks[ii]),
+                        samples=np.mean(samples[ii]), overhead=overhead)
+
+        header = (
+            f'{"":>24s} {"n":>7s} ' + ' '.join(f'{k:>10s}' for k in Quad.PHASES) +
+            f' {"chunks":>7s} {"samples":>9s} {"overhead":>8s}')
+        print(header)
+        result = dict(fate=dict(), region=dict())
+        for f in np.unique(table['outcome']):
+            result['fate'][Fate.labels[f]] = row(Fate.labels[f], table['outcome'] == f)
+        result['fate']['all'] = row('all', np.ones(len(keep), dtype=bool))
+
+        if vars is None:
+            vars = self.axes()
+        vars = vars[:2]
+        if len(vars) > 0:
+            print(header)
+        index = list()
+        ranges = list()
+        for k in vars:
+            x = table[self.vars[k][0]]
+            xb = np.linspace(np.min(x), np.max(x), bins + 1)
+            index.append(np.clip(np.searchsorted(xb, x, side='right') - 1, 0, bins - 1))
+            ranges.append(xb)
+        for ii in itertools.product(range(bins), repeat=len(vars)):
+            sel = np.ones(len(keep), dtype=bool)
+            for i, ix in zip(ii, index):
+                sel &= ix == i
+            if not np.any(sel):
+                continue
+            label = ' '.join(
+                f'{self.vars[k][0]}={xb[i]:.3g}-{xb[i+1]:.3g}'
+                for k, i, xb in zip(vars, ii, ranges))
+            result['region'][label] = row(label, sel)
+        return result
+
+    def points(self):
+        """
+        Parameter dicts of all results, leaving out unset parameters.
+        """
+        table = self.table
+        return [
+            {p: float(row[p]) for p in PARAMS if not np.isnan(row[p])}
+            for row in table]
+
+    def extend(self, dt, task=None, nparallel=None):
+        """
+        Return a copy of the study integrated to the longer horizon `dt`.
+
+        Only points that were stable are integrated again, continuing
+        from their saved end state where the task was `resumable`; the
+        outcomes of points that already went unstable are kept.
+        """
+        if task is None:
+            task = getattr(self, 'task', None)
+        if task is None:
+            task = Quad(resumable=True)
+        points = self.points()
+        outcomes = self.results.result()
+        todo = [j for j, o in enumerate(outcomes) if o.stable]
+        extended = dispatch(
+            task,
+            [dict(points[j], dt=dt, state=getattr(outcomes[j], 'state', None)) for j in todo],
+            nparallel,
+            )
+        for j, o in zip(todo, extended):
+            outcomes[j] = o
+        for p in points:
+            p['dt'] = dt
+        print(f' [{self.__class__.__name__}] extend: integrated {len(todo)} of {len(points)} points')
+        return self.from_results(ColumnResults.from_points(points, outcomes), task)
+
+    @property
+    def table(self):
+        """
+        Structured array of parameters, `outcome` and `time`, built once.
+        """
+        table = self.__dict__.get('_table', None)
+        if table is None:
+            table = store.table(ColumnResults.from_results(self.results).columns)
+            self._table = table
+        return table
+
+    def axes(self):
+        """
+        Keys of `vars` that take more than one value.
+        """
+        vars = ''
+        for k,(v,l, _) in self.vars.items():
+            x = self.table[v]
+            x = x[~np.isnan(x)]
+            if len(x) > 0 and np.any(x != x[0]):
+                vars += k
+        return vars
+
+    def plot(self, vars=None, mode=None, data='fate', rasterized=False):
+        """
+        Map of `data` over the two axes `vars`; returns the figure.
+
+        `data` is `'fate'`, `'time'`, or, averaged over the other
+        parameters (see `probability`), `'probability'` or `'interval'`.
+
+        With `rasterized`, the mesh is drawn as an image in vector output
+        while axes and labels stay vectors.
+        """
+        from matplotlib import pylab as plt
+        from color import ColorBlindRainbow
+
         fig, ax = plt.subplots()
 
+        table = self.table
         if vars is None:
-            vars = ''
-            for k,(v,l, _) in self.vars.items():
-                vals = list()
-                for r in self.results:
-                    x =  getattr(r, v, None)
-                    if x is not None:
-                        if not x in vals:
-                            vals.append(x)
-                            if len(vals) > 1:
-                                continue
-                if len(vals) > 1:
-                    vars += k
-                    continue
+            vars = self.axes()
+            if data in ('probability', 'interval'):
+                sampled = self.__dict__.get('sampled', ())
+                vars = ''.join(k for k in vars if self.vars[k][0] not in sampled)
         coords = list()
         labels = list()
 
@@ -220,43 +578,48 @@ class Study(ParallelProcessor):
         for k in vars:
             v, l, _ = self.vars[k]
             labels.append(l)
-            coords.append(np.asarray([getattr(r, v) for r in self.results]))
+            coords.append(table[v])
+
+        if data in ('probability', 'interval'):
+            cv, p, lo, hi, _ = self.probability(vars)
+            z = p if data == 'probability' else hi - lo
+            cm = ax.pcolormesh(*[edges(x) for x in cv], z.T, vmin=0, vmax=1, rasterized=rasterized)
+            ax.set_xlabel(labels[0], fontsize=16)
+            ax.set_ylabel(labels[1], fontsize=16)
+            if data == 'probability':
+                label = 'probability stable'
+            else:
+                label = f'{self.__dict__.get("confidence", 0.95):.0%} interval width'
+            fig.colorbar(cm, label=label)
+            fig.tight_layout()
+            return fig
 
         if data == 'time':
-            rr = np.asarray([r.time for r in self.results.result()])
-            c = np.log10(np.maximum(rr / YR, 1))
+            c = np.log10(np.maximum(table['time'] / YR, 1))
         elif data == 'fate':
-            rr = np.asarray([r.outcome for r in self.results.result()])
+            rr = table['outcome']
             rv = np.unique(rr)
             c = Fate.colarr[rr]
         else:
             raise AttributeError(f'Unknown data "{data}".')
 
+        cv, ii = zip(*[np.unique(cx, return_inverse=True) for cx in coords])
         if mode is None:
-            dim = np.asarray([len(np.unique(cx)) for cx in coords])
-            if np.product(dim) == c.shape[0]:
+            dim = np.asarray([len(x) for x in cv])
+            if np.prod(dim) == c.shape[0]:
                 mode = 'fill'
 
         if mode == 'fill':
-            cb = list()
-            ii = list()
-            for cx in coords:
-                cv = np.unique(cx)
-                cc = np.ndarray(len(cv)+1)
-                cc[1:-1] = 0.5 * (cv[1:] + cv[:-1])
-                cc[[0,-1]] = 0.5 * (3 * cv[[0,-1]] - cv[[1,-2]])
-                cb.append(cc)
-                ii.append(np.searchsorted(cc, cx, side='right') - 1)
-
-            z = np.ndarray((len(cb[0])-1, len(cb[1])-1) + c.shape[1:])
+            cb = [edges(x) for x in cv]
+            z = np.full((len(cv[0]), len(cv[1])) + c.shape[1:], np.nan)
             z[ii[0], ii[1]] = c
 
             if data == 'time':
-                cm = ax.pcolormesh(*cb, z.swapaxes(0,1), vmin=0, cmap=ColorBlindRainbow())
+                cm = ax.pcolormesh(*cb, z.swapaxes(0,1), vmin=0, cmap=ColorBlindRainbow(), rasterized=rasterized)
             else:
-                ax.pcolorfast(*cb, z.swapaxes(0,1))
+                ax.pcolorfast(*cb, z.swapaxes(0,1)).set_rasterized(rasterized)
         else:
-            ax.scatter(*coords, color=c)
+            ax.scatter(*coords, color=c, rasterized=rasterized)
 
         ax.set_xlabel(labels[0], fontsize=16)
         ax.set_ylabel(labels[1], fontsize=16)
@@ -267,8 +630,10 @@ class Study(ParallelProcessor):
             self.legend(ax, rv)
 
         fig.tight_layout()
+        return fig
 
     def __setstate__(self, state):
+        state.pop('_table', None)
         super().__setstate__(state)
         if self.version < 10100:
             for r in self.results.results:
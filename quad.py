@@ -0,0 +1,743 @@
+"""
+Simulation core of the grid studies: `Fate`, `Outcome`, `Quad` and
+`dispatch`.
+
+This module imports only NumPy and `multistar`, so that pool and
+cluster workers unpickling a `Quad` do not load matplotlib.  Plotting
+and the `Study` driver live in `grid.py`, which re-exports these names.
+"""
+
+import copy
+import lzma
+import pickle
+import hashlib
+import inspect
+from time import perf_counter
+from multiprocessing import Pool
+
+import numpy as np
+
+from physconst import AU, YR
+from human import time2human
+
+from multistar.generic import multi
+from multistar.config import Config
+from multistar.util import firsttrue
+
+from multistar.interface import STATUS_OK, STATUS_COLLIDE, STATUS_ESCAPE
+
+from store import PARAMS
+import schedule
+
+
+GOLDEN = 0.5 * (1 + np.sqrt(5))
+
+class Fate(object):
+    FAIL = 0
+    STABLE = 1
+    COLLISION = 10
+    EARTHGONE = 20
+    MOONGONE = 21
+    # lost without integration to the end, see `screen.py` and `Chaos`
+    UNSTABLE = 30
+
+    labels = {
+        FAIL: 'fail',
+        STABLE: 'stable',
+        COLLISION: 'collision',
+        EARTHGONE: 'earth gone',
+        MOONGONE: 'moon gone',
+        UNSTABLE: 'unstable',
+        }
+
+    keys = {v:k for k,v in labels.items()}
+
+    # resolved to RGB by `grid.Fate`
+    colornames = {
+        FAIL : 'gray',
+        STABLE: 'k',
+        COLLISION: 'r',
+        EARTHGONE: 'b',
+        MOONGONE: 'y',
+        UNSTABLE: 'c',
+        }
+
+class Outcome(object):
+    VERSION = 10600
+
+    def __init__(self, outcome, time, source=None, summary=None, state=None, profile=None, fidelity=None, chaos=None):
+        if isinstance(outcome, str):
+            outcome = Fate.keys[outcome]
+        self.outcome = outcome
+        self.time = time
+        # None if integrated by `Quad`, otherwise how it was obtained
+        self.source = source
+        self.summary = summary
+        # end state to resume from, see `Quad.resume`
+        self.state = state
+        # phase timings (s) and counters, see `Quad.PHASES`
+        self.profile = profile
+        # horizon `dt`, output interval `dtd` and escape criteria (`monitor`)
+        # of the `Quad` run
+        self.fidelity = fidelity
+        # chaos indicator of the run, see `Chaos`
+        self.chaos = chaos
+        self.version = self.VERSION
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.version < 10100:
+            self.source = None
+            self.version = 10100
+        if self.version < 10200:
+            self.summary = None
+            self.version = 10200
+        if self.version < 10300:
+            self.state = None
+            self.version = 10300
+        if self.version < 10400:
+            self.profile = None
+            self.version = 10400
+        if self.version < 10500:
+            self.fidelity = None
+            self.version = 10500
+        if self.version < 10600:
+            self.chaos = None
+            self.version = 10600
+
+    @property
+    def stable(self):
+        return self.outcome == Fate.STABLE
+
+    @property
+    def unstable(self):
+        return self.outcome != Fate.STABLE
+
+    def __str__(self):
+        s = f'{Fate.labels[self.outcome]}: {time2human(self.time)}'
+        if self.source is not None:
+            s += f' [{self.source}]'
+        return s
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({str(self)})'
+
+class Summary(object):
+    """
+    Constant-size reduction of the trajectory of a `multi` run.
+
+    Keeps the maximum moon-earth separation, the maximum earth-binary
+    distance and the minimum separation of any orbit.  If `nbin > 0`,
+    also keeps an envelope of these over `nbin` time bins; bins are
+    merged pairwise whenever the run outgrows them.  The bins start
+    twice as wide as the first chunk, or as the output interval `dtd` if
+    that is longer.
+    """
+    def __init__(self, nbin=0, dtd=0.):
+        assert nbin % 2 == 0
+        self.dtd = dtd
+        self.n = 0
+        self.moon = 0.
+        self.earth = 0.
+        self.pair = np.inf
+        self.nbin = nbin
+        self.width = None
+        if nbin > 0:
+            self.envelope = np.zeros((3, nbin))
+            self.envelope[2] = np.inf
+
+    def add(self, t, ron):
+        if len(t) == 0:
+            return
+        self.n += len(t)
+        self.moon = max(self.moon, np.max(ron[0]))
+        self.earth = max(self.earth, np.max(ron[2]))
+        pair = np.min(ron, axis=0)
+        self.pair = min(self.pair, np.min(pair))
+        if self.nbin == 0:
+            return
+        if self.width is None and max(t[-1], self.dtd) > 0:
+            self.width = 2 * max(t[-1], self.dtd) / self.nbin
+        if self.width is None:
+            # only samples at t=0 so far
+            k = np.zeros(len(t), dtype=np.int64)
+        else:
+            while t[-1] >= self.width * self.nbin:
+                self.merge()
+            k = np.minimum((t / self.width).astype(np.int64), self.nbin - 1)
+        np.maximum.at(self.envelope[0], k, ron[0])
+        np.maximum.at(self.envelope[1], k, ron[2])
+        np.minimum.at(self.envelope[2], k, pair)
+
+    def merge(self):
+        e = self.envelope.reshape(3, -1, 2)
+        h = self.nbin // 2
+        self.envelope[:2, :h] = np.max(e[:2], axis=-1)
+        self.envelope[2, :h] = np.min(e[2], axis=-1)
+        self.envelope[:2, h:] = 0.
+        self.envelope[2, h:] = np.inf
+        self.width *= 2
+
+    @property
+    def time(self):
+        return (np.arange(self.nbin) + 0.5) * self.width
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}(n={self.n}, '
+            f'moon={self.moon / AU:.5g} AU, earth={self.earth / AU:.5g} AU, '
+            f'pair={self.pair / AU:.5g} AU)')
+
+
+class Chaos(object):
+    """
+    MEGNO-like chaos indicator from the divergence of a shadow run.
+
+    The shadow starts with the moon phase shifted by `Quad.SHADOW`.  The
+    divergence `d` is the running maximum of the relative difference of
+    the moon-earth and earth-binary separations of the two runs, and
+    `Y(t) = 2/t int s dln(d)` is averaged over time as MEGNO (Cincotta &
+    Simo 2000): the mean tends to 2 for regular orbits and grows as
+    `lambda t / 2` for chaotic ones.  The shadow is saturated once `d`
+    reaches `SATURATE` or its fate differs; the orbit is then chaotic.
+
+    The mean MEGNO climbs from 0 towards 2, so an orbit only counts as
+    regular once it has stayed within `TOLERANCE` of 2 at the end of the
+    last `CONVERGED` chunks.
+    """
+    SATURATE = 1e-2
+    # mean MEGNO above which an orbit is chaotic
+    CHAOTIC = 5.
+    TOLERANCE = 0.2
+    CONVERGED = 3
+
+    def __init__(self):
+        self.t = 0.
+        self.lnd = None
+        self.s = 0.
+        self.y = 0.
+        # time the shadow saturated
+        self.saturated = None
+        # mean MEGNO at the end of the last `CONVERGED` chunks
+        self.chunks = list()
+
+    def add(self, t, ron, shadow):
+        n = min(ron.shape[1], shadow.shape[1])
+        if n == 0 or self.saturated is not None:
+            return
+        t = t[:n]
+        d = np.sqrt(np.sum(((shadow[::2, :n] - ron[::2, :n]) / ron[::2, :n])**2, axis=0))
+        lnd = np.log(np.maximum(d, 1e-16))
+        if self.lnd is None:
+            self.lnd = lnd[0]
+        lnd = np.maximum.accumulate(np.maximum(lnd, self.lnd))
+        s = self.s + np.cumsum(t * np.diff(lnd, prepend=self.lnd))
+        y = np.divide(2 * s, t, out=np.zeros_like(s), where=t > 0)
+        self.y += np.sum(y * np.diff(t, prepend=self.t))
+        self.s = s[-1]
+        self.lnd = lnd[-1]
+        self.t = t[-1]
+        if self.lnd >= np.log(self.SATURATE):
+            self.saturate(t[firsttrue(lnd >= np.log(self.SATURATE))])
+
+    def saturate(self, t):
+        if self.saturated is None:
+            self.saturated = t
+
+    def chunk(self):
+        """
+        Record the mean MEGNO at the end of a chunk.
+        """
+        self.chunks = self.chunks[1 - self.CONVERGED:] + [float(self.megno)]
+
+    @property
+    def megno(self):
+        """
+        Mean MEGNO up to the last sample.
+        """
+        if self.t == 0:
+            return np.nan
+        return self.y / self.t
+
+    @property
+    def lyapunov(self):
+        """
+        Estimate of the largest Lyapunov exponent (1/s).
+        """
+        if self.t == 0:
+            return np.nan
+        return 2 * self.megno / self.t
+
+    @property
+    def state(self):
+        """
+        `'chaotic'`, `'regular'`, or None if not yet clear.
+        """
+        if self.saturated is not None or self.megno > self.CHAOTIC:
+            return 'chaotic'
+        if (len(self.chunks) == self.CONVERGED and
+                np.all(np.abs(np.array(self.chunks) - 2) < self.TOLERANCE)):
+            return 'regular'
+        return None
+
+    def __repr__(self):
+        s = f'{self.__class__.__name__}(t={time2human(self.t)}, megno={self.megno:.3g}'
+        if self.saturated is not None:
+            s += f', saturated={time2human(self.saturated)}'
+        return s + ')'
+
+
+class Quad(object):
+    # bump when changes to the integration or analysis alter outcomes
+    VERSION = 10100
+
+    # escape criteria on the orbit separations `ron` (moon-earth, -, earth-binary)
+    MOONGONE = 0.01 * AU
+    EARTHGONE = 10 * AU
+
+    # timed phases of a call
+    PHASES = ('setup', 'construct', 'integrate', 'analyze')
+
+    # moon phase offset of the shadow run of `Chaos` (deg)
+    SHADOW = 1e-6
+    # longest chunk in output samples, bounds the memory of a run
+    # unless the `trajectory` is kept
+    SAMPLES = 2**14
+
+    # regular orbits are stopped after at least this many times `early`
+    EARLY = 5
+
+    def __init__(
+            self,
+            toml='binary_martin_base2.toml',
+            monitor=True,
+            dtd=0.1*YR,
+            trajectory=False,
+            envelope=0,
+            resumable=False,
+            profile=False,
+            chaos=False,
+            early=None,
+            ):
+        """
+        If `monitor` is set, the escape criteria are passed to the
+        integrator as per-orbit cutoffs so that it stops at the first
+        violation rather than at the end of the current chunk.  They
+        replace the `cutoff` of a call, so a `cutoff` other than the
+        default is rejected.
+
+        Output samples (every `dtd`) are reduced chunk by chunk into a
+        `Summary` (with an `envelope` of that many time bins) attached to
+        the `Outcome`, and then dropped.  Only with `trajectory` is the
+        full run kept, as `self.m`.
+
+        If `resumable` is set, stable outcomes carry the compressed end
+        state of the run so it can be continued by `resume`.
+
+        If `profile` is set, outcomes carry the time spent in each of
+        `PHASES` and the number of chunks and output samples.
+
+        If `chaos` is set, a shadow run is integrated alongside and
+        outcomes carry its `Chaos` indicator.  If `early` is set (a time,
+        implies `chaos`), the first chunk is `early` long and a run stops
+        at the end of a chunk once the indicator is clearly chaotic, or,
+        after at least `EARLY` times `early`, has converged to regular.
+        It is then classified `Fate.UNSTABLE` at that time or
+        `Fate.STABLE` up to `dt`, with `source='chaos'`.  Resumed runs
+        have no shadow.
+        """
+        self.config = Config(toml)
+        self.monitor = monitor
+        self.dtd = dtd
+        self.trajectory = trajectory
+        self.envelope = envelope
+        self.resumable = resumable
+        self.profile = profile
+        self.chaos = chaos or early is not None
+        self.early = early
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # archived tasks predate the options; they were integrated with
+        # the scalar 11 AU cutoff, not the per-orbit monitor
+        self.__dict__.setdefault('monitor', False)
+        defaults = inspect.signature(Quad.__init__).parameters
+        for k in ('monitor', 'dtd', 'trajectory', 'envelope', 'resumable', 'profile', 'chaos', 'early'):
+            self.__dict__.setdefault(k, defaults[k].default)
+
+    def template(self):
+        """
+        Return a copy of the base config to patch for one grid point.
+
+        Scalar entries are shared with the base config, as `setup` only
+        replaces them; mutable values (e.g. the `star.*.euler_deg` lists)
+        are deep-copied so that no grid point can change another's.  If
+        copies of the config turn out to share their storage, which is
+        probed once per task, the whole config is deep-copied.
+        """
+        mutable = self.__dict__.get('_mutable')
+        if mutable is None:
+            mutable = self._mutable = self.mutable()
+        if mutable is False:
+            return self.config.copy()
+        config = copy.copy(self.config)
+        for k in mutable:
+            config[k] = copy.deepcopy(self.config[k])
+        return config
+
+    def mutable(self):
+        """
+        Keys of the mutable entries of the base config, or False if a
+        shallow copy is not independent of the config it was made from.
+        """
+        base = self.config.copy()
+        marker = object()
+        copy.copy(base)['binary.2.en'] = marker
+        if base.get('binary.2.en') is marker:
+            return False
+        scalar = (type(None), bool, int, float, complex, str, bytes)
+        return tuple(k for k, v in self.config.items() if not isinstance(v, scalar))
+
+    def setup(self, en=0, an=0.1, i=0, q=1, pm=0, pb=0, cutoff=11*AU):
+        """
+        Return a copy of the base config with the parameters of a grid point.
+
+        With `monitor`, `cutoff` is replaced by the escape criteria and
+        must be left at its default.
+        """
+        if self.monitor and cutoff != 11*AU:
+            raise ValueError(f'cutoff={cutoff} has no effect with monitor=True.')
+        config = self.template()
+        if en is not None:
+            config['binary.2.en'] = en
+        if an is not None:
+            config['binary.2.an_AU'] = an
+        if i is not None:
+            config['binary.2.inclination_deg'] = i
+        if q is not None:
+            assert 0.1 <= q <= 1
+            m1, m2 = np.array([1, q]) / (1 + q)
+            config['star.3.M_Msun'] = m1
+            config['star.4.M_Msun'] = m2
+
+            # TODO - FIX: need to adjust radii properly - (DONE)
+        if m1 <= 0.5:
+            config['star.3.S_Rsun'] = m1**0.56
+        else:
+            config['star.3.S_Rsun'] = m1**0.79
+
+        if m2 <= 0.5:
+            config['star.4.S_Rsun'] = m2**0.56
+        else:
+            config['star.4.S_Rsun'] = m2**0.79
+
+        if pm is not None:
+            config['binary.1.phase'] = pm
+        if pb is not None:
+            config['binary.2.phase'] = pb
+        if self.monitor:
+            cutoff = [self.MOONGONE, 0., self.EARTHGONE]
+        if cutoff is not None:
+            config.set('cutoff', cutoff)
+        self.cutoff = cutoff
+        return config
+
+    def __call__(self, en=0, an=0.1, i=0, q=1, pm=0, pb=0, dt=1*YR, cutoff=11*AU, state=None):
+        """
+        Integrate one grid point for time `dt`.
+
+        If `state` is given, the run it was saved from is continued up to
+        `dt` instead; the other parameters are then ignored.
+        """
+        if state is not None:
+            return self.resume(state, dt)
+
+        t0 = perf_counter()
+        config = self.setup(en=en, an=an, i=i, q=q, pm=pm, pb=pb, cutoff=cutoff)
+        t1 = perf_counter()
+        m = multi(config)
+        shadow = None
+        if self.chaos:
+            pm = (0 if pm is None else pm) + self.SHADOW
+            shadow = multi(self.setup(en=en, an=an, i=i, q=q, pm=pm, pb=pb, cutoff=cutoff))
+        summary = Summary(self.envelope, self.dtd)
+        t2 = perf_counter()
+
+        outcome = self.integrate(m, summary, dt, profile=dict(setup=t1-t0, construct=t2-t1), shadow=shadow)
+
+        # for DEBUG only
+        if self.trajectory:
+            self.setup_config = config
+
+        return outcome
+
+    def resume(self, state, dt):
+        """
+        Continue a run from `Outcome.state` up to total time `dt`.
+        """
+        t0 = perf_counter()
+        m, summary = pickle.loads(lzma.decompress(state))
+        t1 = perf_counter()
+        return self.integrate(m, summary, dt, m.t[-1], profile=dict(setup=t1-t0, construct=0.))
+
+    def integrate(self, m, summary, dt, tt=0, profile=None, shadow=None):
+        if profile is None:
+            profile = dict(setup=0., construct=0.)
+        profile.update(integrate=0., analyze=0., chunks=0, samples=0)
+        chaos = None if shadow is None else Chaos()
+        limit = np.inf if self.trajectory else self.SAMPLES * self.dtd
+        tx = np.minimum(dt - tt, min(1000*YR if self.early is None else self.early, limit))
+        while True:
+            n = 0 if getattr(m, 't', None) is None else len(m.t)
+            t0 = perf_counter()
+            m.rund(tx, dtd=self.dtd)
+            if shadow is not None:
+                ns = 0 if shadow.t is None else len(shadow.t)
+                shadow.rund(tx, dtd=self.dtd)
+            t1 = perf_counter()
+            tt += tx
+            outcome =  self.analyze(m, tt, n)
+            if shadow is not None:
+                shadow = self.follow(m, shadow, chaos, n, ns)
+            t2 = perf_counter()
+            profile['integrate'] += t1 - t0
+            profile['analyze'] += t2 - t1
+            profile['chunks'] += 1
+            if m.t is not None:
+                profile['samples'] += len(m.t) - n
+                summary.add(m.t[n:], m.ron[:, n:])
+                if not self.trajectory:
+                    self.trim(m)
+            if outcome.unstable:
+                break
+            if np.allclose(tt, dt):
+                break
+            if self.early is not None and chaos is not None:
+                state = chaos.state
+                if state == 'chaotic':
+                    outcome = Outcome(Fate.UNSTABLE, m.t[-1], source='chaos')
+                    break
+                if state == 'regular' and tt >= self.EARLY * self.early:
+                    outcome = Outcome(Fate.STABLE, dt, source='chaos')
+                    break
+            tx = np.minimum(dt - tt, min(tx * GOLDEN, limit))
+        outcome.summary = summary
+        outcome.chaos = chaos
+        outcome.fidelity = dict(dt=float(dt), dtd=float(self.dtd), monitor=bool(self.monitor))
+        if self.profile:
+            outcome.profile = profile
+        if self.resumable and outcome.stable and m.t is not None:
+            outcome.state = self.state(m, summary)
+
+        # for DEBUG only
+        if self.trajectory:
+            self.m = m
+
+        print(f' [{self.__class__.__name__}] {outcome!s}')
+
+        return outcome
+
+    def key(self, **kwargs):
+        """
+        Resolved parameter tuple `(q, an, en, i, pm, pb, dt)` of a call.
+        """
+        args = inspect.signature(self.__call__).bind(**kwargs)
+        args.apply_defaults()
+        return tuple(
+            None if (x := args.arguments[p]) is None else float(x)
+            for p in PARAMS)
+
+    def digest(self, **kwargs):
+        """
+        Content hash of a call: the resolved config, `dt`, the options
+        that affect the outcome, and the code version.
+        """
+        args = inspect.signature(self.__call__).bind(**kwargs)
+        args.apply_defaults()
+        args = {
+            k: float(x) if k in PARAMS and x is not None else x
+            for k, x in args.arguments.items()}
+        dt = args.pop('dt')
+        args.pop('state')
+        config = self.setup(**args)
+        h = hashlib.sha256()
+        h.update(pickle.dumps(config, protocol=4))
+        h.update(pickle.dumps(
+            (dt, self.__class__.__name__, self.options(), self.VERSION, Outcome.VERSION),
+            protocol=4))
+        return h.hexdigest()
+
+    def options(self):
+        """
+        Settings other than the grid point that affect the outcome.
+        """
+        if self.chaos:
+            return (self.monitor, self.dtd, self.chaos, self.early)
+        return (self.monitor, self.dtd)
+
+    def follow(self, m, shadow, chaos, n, ns):
+        """
+        Add the last chunk of `m` and of its `shadow` run, from output
+        samples `n` and `ns` on, to `chaos`.
+
+        Returns the trimmed shadow, or None once it is saturated.
+        """
+        if shadow.t is None:
+            chaos.saturate(0.)
+            return None
+        if m.t is not None:
+            chaos.add(m.t[n:], m.ron[:, n:], shadow.ron[:, ns:])
+        chaos.chunk()
+        if shadow.status != STATUS_OK:
+            # the shadow stopped at a cutoff
+            chaos.saturate(shadow.t[-1])
+        if chaos.saturated is not None:
+            return None
+        self.trim(shadow)
+        return shadow
+
+    def state(self, m, summary):
+        """
+        Compressed end state of `m`, with its output history trimmed.
+        """
+        if self.trajectory:
+            m = copy.copy(m)
+            self.trim(m)
+        return lzma.compress(pickle.dumps((m, summary)))
+
+    @staticmethod
+    def trim(m):
+        """
+        Drop the output history of `m` except for the last sample.
+        """
+        m.t = m.t[-1:]
+        m.ron = m.ron[:, -1:]
+
+    def analyze(self, m, dt, start=0):
+        """
+        Classify the run `m` at time `dt`.
+
+        Only output samples from index `start` on are checked against the
+        escape criteria; earlier ones were checked by previous calls.
+        """
+
+        # analize result
+
+        if not hasattr(m, 't'):
+            m.t = None
+        if m.t is None:
+            return Outcome(Fate.FAIL, 0)
+
+        # integrator stopped at the crossing of a cutoff
+        if self.monitor:
+            if m.status == STATUS_ESCAPE:
+                if m.status_stars[0] == 1:
+                    return Outcome(Fate.MOONGONE, m.t[-1])
+                return Outcome(Fate.EARTHGONE, m.t[-1])
+            if m.status == STATUS_COLLIDE:
+                return Outcome(Fate.COLLISION, m.t[-1])
+
+        #if not np.allclose(m.t[-1], dt):
+            # TODO - test what collided (use m.rn)
+         #   return Outcome(Fate.COLLISION, m.t[-1])
+
+        ro = m.ron
+        # TODO - test whether moon is further from earth than (solar) hill radius
+        #if ((ii := np.argmax(ro[0, :] > 0.01 * AU)) > 0):
+           # return Outcome(Fate.MOONGONE, m.t[ii])
+        # TODO - test whether moon and earth escaped jointly
+        #if ((ii := np.argmax(ro[2, :] > 2 * AU)) > 0):
+         #   return Outcome(Fate.EARTHGONE, m.t[ii] )
+
+        # the reductions avoid boolean temporaries in the common case
+        if np.max(ro[0, start:], initial=0) > self.MOONGONE:
+            ii = start + firsttrue(ro[0, start:] > self.MOONGONE)
+            return Outcome(Fate.MOONGONE, m.t[max(ii-1, 0)])
+        if np.max(ro[2, start:], initial=0) > self.EARTHGONE:
+            ii = start + firsttrue(ro[2, start:] > self.EARTHGONE)
+            return Outcome(Fate.EARTHGONE, m.t[max(ii-1, 0)])
+
+        if not np.allclose(m.t[-1], dt):
+            return Outcome(Fate.COLLISION, m.t[-1])
+
+        return Outcome(Fate.STABLE, m.t[-1])
+
+
+# values of parameters not set in a call
+DEFAULTS = {
+    p: inspect.signature(Quad.__call__).parameters[p].default
+    for p in PARAMS}
+
+
+def unwrap(task):
+    """
+    The `Quad` inside `Checkpoint` and `Cache` wrappers, or None.
+    """
+    while task is not None and not isinstance(task, Quad):
+        task = getattr(task, 'task', None)
+    return task
+
+
+_task = None
+
+def _init(task):
+    global _task
+    _task = task
+
+def _run(point):
+    return _task(**point)
+
+def _batch(points):
+    return _task.batch(points)
+
+def dispatch(task, points, nparallel=None, cost=None, cluster=None):
+    """
+    Evaluate `task(**point)` for each dict in `points` on a process pool.
+
+    Returns the outcomes in the order of `points`.  Tasks that provide a
+    `lookup` method (`Checkpoint`, `Cache`) are asked first and only the
+    points they do not know are sent to the pool.  Tasks that provide a
+    `batch` method (`batch.BatchQuad`) are sent blocks of `task.size`
+    points at a time.  Otherwise, if a predicted `cost` per point is
+    given, points are run by the work-stealing `schedule.run`.
+
+    With a `cluster.Coordinator`, points are served to remote workers
+    instead of a local pool; the workers get the task without its
+    wrappers, whose `record` method is called with the outcomes here.
+    """
+    if not hasattr(task, 'lookup'):
+        return _pool(task, points, nparallel, cost, cluster)
+    outcomes = task.lookup(points)
+    todo = [j for j, o in enumerate(outcomes) if o is None]
+    if cost is not None:
+        cost = np.asarray(cost)[todo]
+    for j, o in zip(todo, _pool(task, [points[j] for j in todo], nparallel, cost, cluster)):
+        outcomes[j] = o
+    return outcomes
+
+def _pool(task, points, nparallel=None, cost=None, cluster=None):
+    if len(points) == 0:
+        return list()
+    if cluster is not None:
+        # workers run the bare task; the wrappers record on this host
+        inner = task
+        while hasattr(inner, 'record'):
+            inner = inner.task
+        outcomes = cluster.run(inner, points)
+        if hasattr(task, 'record'):
+            task.record(points, outcomes)
+        return outcomes
+    if hasattr(task, 'batch'):
+        blocks = [points[j:j + task.size] for j in range(0, len(points), task.size)]
+        if nparallel == 1:
+            results = [task.batch(b) for b in blocks]
+        else:
+            with Pool(nparallel, initializer=_init, initargs=(task,)) as pool:
+                results = pool.map(_batch, blocks, chunksize=1)
+        return [o for r in results for o in r]
+    if nparallel == 1:
+        return [task(**p) for p in points]
+    if cost is not None:
+        return schedule.run(task, points, cost, nparallel)
+    with Pool(nparallel, initializer=_init, initargs=(task,)) as pool:
+        return pool.map(_run, points, chunksize=1)
@@ -0,0 +1,202 @@
+"""
+Render the fate and time maps of many studies in a process pool.
+
+    python render.py *.xz *.grid -n 8
+
+writes `<name>.pdf` and `<name>_time.pdf` next to each archive or
+columnar store.  The mesh is rasterized at `--dpi` while axes, labels
+and legend stay vectors, which keeps the files small and fast to write.
+
+A figure is skipped if its source study and style are unchanged since
+it was last written; the hashes are kept in `render.json` in the output
+directory.  Use `--force` to render everything.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from multiprocessing import Pool
+
+VERSION = 10000
+
+MANIFEST = 'render.json'
+
+# data mode -> suffix of the figure name
+SUFFIX = {'fate': '', 'time': '_time'}
+
+
+def source_hash(filename):
+    """
+    Content hash of an archive or of the files of a columnar store.
+    """
+    path = Path(filename)
+    h = hashlib.sha256()
+    files = sorted(path.iterdir()) if path.is_dir() else [path]
+    for f in files:
+        h.update(f.name.encode())
+        with open(f, 'rb') as fp:
+            for block in iter(lambda: fp.read(2**20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+def style_hash(data, fmt, dpi, rasterized):
+    import matplotlib
+    style = dict(
+        version = VERSION,
+        matplotlib = matplotlib.__version__,
+        data = data,
+        format = fmt,
+        dpi = dpi,
+        rasterized = rasterized,
+        )
+    return hashlib.sha256(json.dumps(style, sort_keys=True).encode()).hexdigest()
+
+
+def output(filename, data, fmt, outdir=None):
+    path = Path(filename)
+    if outdir is None:
+        outdir = path.parent
+    name = path.name
+    for suffix in ('.xz', '.grid'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return Path(outdir) / f'{name}{SUFFIX[data]}.{fmt}'
+
+
+def load(filename):
+    import store
+    from grid import Study
+    if store.is_store(filename):
+        return Study.from_store(filename)
+    return store.read_archive(filename)
+
+
+def agg():
+    """
+    Pool initializer: draw with Agg in the workers.
+
+    The backend of the calling process is left alone, so as not to close
+    the figures of an interactive session.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render(job):
+    """
+    Render all `data` modes of one study; runs in a pool worker.
+    """
+    filename, figures, dpi, rasterized = job[1:]
+    from matplotlib import pylab as plt
+    study = load(filename)
+    for data, target in figures:
+        fig = study.plot(data=data, rasterized=rasterized)
+        fig.savefig(target, dpi=dpi)
+        plt.close(fig)
+    return job
+
+
+def render(
+        filenames,
+        data=('fate', 'time'),
+        fmt='pdf',
+        dpi=300,
+        rasterized=True,
+        outdir=None,
+        nparallel=None,
+        force=False,
+        ):
+    """
+    Render the `data` maps of all `filenames`, skipping unchanged figures.
+
+    Returns the list of figures written.
+    """
+    if outdir is not None:
+        Path(outdir).mkdir(parents=True, exist_ok=True)
+    manifests = dict()
+    jobs = list()
+    written = list()
+    hashes = dict()
+    for filename in filenames:
+        source = source_hash(filename)
+        figures = list()
+        for d in data:
+            target = output(filename, d, fmt, outdir)
+            manifest = manifests.setdefault(target.parent, read_manifest(target.parent))
+            h = hashlib.sha256((source + style_hash(d, fmt, dpi, rasterized)).encode()).hexdigest()
+            if not force and target.exists() and manifest.get(target.name) == h:
+                continue
+            figures.append((d, str(target)))
+            hashes[target] = h
+        if len(figures) > 0:
+            jobs.append((len(jobs), str(filename), figures, dpi, rasterized))
+    print(f' [render] {sum(len(j[2]) for j in jobs)} figures to render from {len(jobs)} studies')
+    pool = None
+    try:
+        if nparallel == 1:
+            done = map(_render, jobs)
+        else:
+            pool = Pool(nparallel, initializer=agg)
+            done = pool.imap_unordered(_render, jobs)
+        # record each study as it finishes, so an interrupted run resumes
+        for job in done:
+            for _, target in job[2]:
+                target = Path(target)
+                manifests[target.parent][target.name] = hashes[target]
+                written.append(target)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        for path, manifest in manifests.items():
+            write_manifest(path, manifest)
+    return written
+
+
+def read_manifest(path):
+    try:
+        with open(Path(path) / MANIFEST, 'rt') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return dict()
+
+
+def write_manifest(path, manifest):
+    filename = Path(path) / MANIFEST
+    tmp = filename.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp, 'wt') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, filename)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render study maps')
+    parser.add_argument('filenames', nargs='+', help='.xz archives or columnar stores')
+    parser.add_argument('-n', '--nparallel', type=int, default=None)
+    parser.add_argument('-o', '--outdir', default=None, help='default: next to the source')
+    parser.add_argument('-f', '--format', default='pdf')
+    parser.add_argument('--dpi', type=int, default=300, help='resolution of the rasterized mesh')
+    parser.add_argument('--data', default='fate,time', help='comma-separated data modes')
+    parser.add_argument('--vector', action='store_true', help='do not rasterize the mesh')
+    parser.add_argument('--force', action='store_true', help='render unchanged figures too')
+    args = parser.parse_args(argv)
+    agg()
+    written = render(
+        args.filenames,
+        data=args.data.split(','),
+        fmt=args.format,
+        dpi=args.dpi,
+        rasterized=not args.vector,
+        outdir=args.outdir,
+        nparallel=args.nparallel,
+        force=args.force,
+        )
+    for target in written:
+        print(f' [render] {target}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
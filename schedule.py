@@ -0,0 +1,133 @@
+"""
+Cost-predicted, work-stealing execution of `Quad` tasks.
+
+Grid points differ in cost by orders of magnitude: unstable points stop
+early, stable points run the full `dt`.  `predict` estimates the cost of
+each point from the nearest finished point of a reference study (e.g. a
+coarse pass).  `run` deals the points to one queue per worker, longest
+first and balanced by predicted cost; a worker whose queue is empty
+steals the cheaper half of the most loaded remaining queue.
+"""
+
+import os
+import heapq
+import traceback
+import multiprocessing
+
+import numpy as np
+
+from store import PARAMS
+
+
+def predict(points, table, chunk=1024):
+    """
+    Predicted cost of `points`, in integrated time, from a reference `table`.
+
+    Each point gets the time of its nearest reference point in parameter
+    space normalised to the range of the reference, capped at its own `dt`.
+    """
+    params = [
+        p for p in PARAMS
+        if p != 'dt' and np.any(~np.isnan(table[p]))]
+    ref = np.stack([table[p] for p in params], axis=-1)
+    lo = np.nanmin(ref, axis=0)
+    span = np.nanmax(ref, axis=0) - lo
+    span[span == 0] = 1
+    ref = np.nan_to_num((ref - lo) / span)
+    x = np.array([[p.get(k, np.nan) for k in params] for p in points], dtype=np.float64)
+    x = np.nan_to_num((x - lo) / span)
+    dt = np.array([p.get('dt', np.inf) for p in points], dtype=np.float64)
+    cost = np.ndarray(len(points))
+    for j in range(0, len(points), chunk):
+        d = np.sum((x[j:j + chunk, np.newaxis, :] - ref[np.newaxis, :, :])**2, axis=-1)
+        cost[j:j + chunk] = table['time'][np.argmin(d, axis=1)]
+    return np.minimum(cost, dt)
+
+
+def deal(cost, nparallel):
+    """
+    Split point indices into `nparallel` lists, longest first, balancing cost.
+    """
+    lists = [list() for _ in range(nparallel)]
+    heap = [(0., k) for k in range(nparallel)]
+    for j in np.argsort(-cost, kind='stable'):
+        load, k = heapq.heappop(heap)
+        lists[k].append(j)
+        heapq.heappush(heap, (load + cost[j], k))
+    return lists
+
+
+def _worker(k, task, points, cost, order, lo, hi, lock, results, grain):
+    while True:
+        with lock:
+            if lo[k] >= hi[k]:
+                # steal the cheaper half of the most loaded queue
+                v = max(
+                    range(len(lo)),
+                    key=lambda v: (np.sum(cost[order[lo[v]:hi[v]]]), hi[v] - lo[v]))
+                n = hi[v] - lo[v]
+                if n == 0:
+                    break
+                m = (n + 1) // 2
+                hi[v] -= m
+                lo[k], hi[k] = hi[v], hi[v] + m
+            # take work worth at least `grain`, but at least one point
+            j0 = lo[k]
+            j1 = j0 + 1
+            c = cost[order[j0]]
+            while j1 < hi[k] and c < grain:
+                c += cost[order[j1]]
+                j1 += 1
+            lo[k] = j1
+            take = [order[j] for j in range(j0, j1)]
+        for j in take:
+            try:
+                results.put((j, task(**points[j])))
+            except Exception:
+                results.put((j, RuntimeError(traceback.format_exc())))
+    results.put((None, None))
+
+
+def run(task, points, cost, nparallel=None, grain=None):
+    """
+    Evaluate `task(**point)` for all `points` ordered by predicted `cost`.
+
+    `grain` is the minimum predicted cost a worker takes at a time;
+    defaults to a hundredth of the mean cost.
+    """
+    if nparallel is None:
+        nparallel = os.cpu_count()
+    cost = np.asarray(cost, dtype=np.float64)
+    if grain is None:
+        grain = 0.01 * np.mean(cost)
+    lists = deal(cost, nparallel)
+    ctx = multiprocessing.get_context()
+    order = ctx.Array('l', [j for l in lists for j in l], lock=False)
+    bounds = np.cumsum([0] + [len(l) for l in lists])
+    lo = ctx.Array('l', bounds[:-1].tolist(), lock=False)
+    hi = ctx.Array('l', bounds[1:].tolist(), lock=False)
+    lock = ctx.Lock()
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(
+            target=_worker,
+            args=(k, task, points, cost, order, lo, hi, lock, results, grain),
+            daemon=True)
+        for k in range(nparallel)]
+    for w in workers:
+        w.start()
+    outcomes = [None] * len(points)
+    running = nparallel
+    while running > 0:
+        j, o = results.get()
+        if j is None:
+            running -= 1
+            continue
+        if isinstance(o, Exception):
+            for w in workers:
+                w.terminate()
+            raise o
+        outcomes[j] = o
+    for w in workers:
+        w.join()
+    return outcomes
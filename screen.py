@@ -0,0 +1,130 @@
+"""
+Analytic pre-screen of grid points with empirical stability criteria.
+
+The Earth(-Moon) orbit (`binary.3`) around the star binary (`binary.2`)
+is compared with the critical circumbinary distance of Holman & Wiegert
+(1999, AJ 117, 621) and the hierarchical-triple limit of Mardling &
+Aarseth (2001, MNRAS 321, 398).  Points whose Earth pericentre lies
+outside both limits by more than `margin` are sure-stable; points inside
+both by more than `margin`, or whose stars touch at pericentre, are
+sure-unstable; the rest are uncertain and need `Quad`.
+
+    screen = Screen(margin=0.3, audit=0.05)
+    study = Study.sweep(screen=screen, en=..., an=..., dt=...)
+
+Screened outcomes are marked `source='screen'`.  Sure-unstable points
+without colliding stars get `Fate.UNSTABLE` as the criteria say nothing
+about which body is lost, or when.  A random `audit` fraction of the
+screened points is integrated anyway, and disagreements are reported.
+"""
+
+import numpy as np
+
+from quad import Fate, Outcome, DEFAULTS, unwrap
+from batch import quantity, LENGTH, MASS
+
+SURE_UNSTABLE = -1
+UNCERTAIN = 0
+SURE_STABLE = 1
+
+
+def holman_wiegert(e, mu):
+    """
+    Critical circumbinary semimajor axis in units of the binary's.
+    """
+    return (
+        1.60 + 5.10 * e - 2.22 * e**2 + 4.12 * mu - 4.27 * e * mu
+        - 5.09 * mu**2 + 4.61 * e**2 * mu**2)
+
+
+def mardling_aarseth(e, q, i):
+    """
+    Critical outer pericentre in units of the inner semimajor axis.
+
+    `e` is the outer eccentricity, `q` the outer-to-inner mass ratio and
+    `i` the mutual inclination (rad).
+    """
+    return 2.8 * ((1 + q) * (1 + e) / np.sqrt(1 - e))**0.4 * (1 - 0.3 * i / np.pi)
+
+
+class Screen(object):
+    """
+    Classify points as sure-stable, sure-unstable or uncertain.
+    """
+    def __init__(self, margin=0.3, audit=0.05, seed=0):
+        self.margin = margin
+        self.audit = audit
+        self.seed = seed
+
+    def criteria(self, config):
+        """
+        Earth pericentre over the two critical distances, and the binary
+        pericentre over the sum of the stellar radii.
+        """
+        ab = quantity(config, 'binary.2.an', LENGTH)
+        eb = config['binary.2.en']
+        ib = np.deg2rad(config['binary.2.inclination_deg'])
+        ap = quantity(config, 'binary.3.an', LENGTH)
+        ep = config['binary.3.en']
+        m = [quantity(config, f'star.{k}.M', MASS) for k in range(1, 5)]
+        s = [quantity(config, f'star.{k}.S', LENGTH) for k in (3, 4)]
+        if ab == 0:
+            # degenerate binary, leave to `Quad`
+            return np.nan, np.nan, np.nan
+        rp = ap * (1 - ep)
+        hw = holman_wiegert(eb, min(m[2], m[3]) / (m[2] + m[3])) * ab
+        ma = mardling_aarseth(ep, (m[0] + m[1]) / (m[2] + m[3]), ib) * ab
+        return rp / hw, rp / ma, ab * (1 - eb) / (s[0] + s[1])
+
+    def label(self, config):
+        hw, ma, touch = self.criteria(config)
+        if touch < 1:
+            return SURE_UNSTABLE, Fate.COLLISION
+        if min(hw, ma) > 1 + self.margin and touch > 1 + self.margin:
+            return SURE_STABLE, Fate.STABLE
+        if max(hw, ma) < 1 - self.margin:
+            return SURE_UNSTABLE, Fate.UNSTABLE
+        return UNCERTAIN, None
+
+    def classify(self, task, points):
+        """
+        Screened outcomes of `points` (None where uncertain) and the indices
+        of screened points to integrate for audit.
+        """
+        task = unwrap(task)
+        outcomes = list()
+        for p in points:
+            config = task.setup(**{k: x for k, x in p.items() if k not in ('dt', 'state')})
+            label, fate = self.label(config)
+            if label == UNCERTAIN:
+                outcomes.append(None)
+                continue
+            time = p.get('dt', DEFAULTS['dt']) if label == SURE_STABLE else 0.
+            outcomes.append(Outcome(fate, time, source='screen'))
+        screened = [j for j, o in enumerate(outcomes) if o is not None]
+        rng = np.random.default_rng(self.seed)
+        naudit = int(np.ceil(self.audit * len(screened)))
+        audit = sorted(rng.choice(screened, naudit, replace=False).tolist())
+        print(
+            f' [{self.__class__.__name__}] {len(screened)} of {len(points)} points screened, '
+            f'{len(audit)} audited')
+        return outcomes, audit
+
+    def report(self, screened, integrated):
+        """
+        Compare screened with integrated outcomes of the audit sample.
+        """
+        wrong = list()
+        for s, o in zip(screened, integrated):
+            if s.outcome == Fate.UNSTABLE:
+                ok = o.outcome not in (Fate.STABLE, Fate.FAIL)
+            else:
+                ok = s.outcome == o.outcome
+            if not ok:
+                wrong.append((s, o))
+        print(
+            f' [{self.__class__.__name__}] audit: {len(screened) - len(wrong)} of '
+            f'{len(screened)} screened points confirmed')
+        for s, o in wrong:
+            print(f' [{self.__class__.__name__}] screened {s!s}, integrated {o!s}')
+        return wrong
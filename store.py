@@ -0,0 +1,217 @@
+"""
+Columnar on-disk store for `grid.Study` results.
+
+A store is a directory with one `.npy` file per column and a small
+`meta.json` header.  Columns are opened memory-mapped, so a grid can be
+re-plotted without decompressing and unpickling the whole `Study`.
+
+Convert existing archives with
+
+    python store.py 121x121grid_q_en_1KYR_an_0.4.xz ...
+"""
+
+import sys
+import json
+import lzma
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+VERSION = 10000
+
+PARAMS = ('q', 'an', 'en', 'i', 'pm', 'pb', 'dt')
+
+COLUMNS = {p: np.dtype(np.float64) for p in PARAMS}
+COLUMNS['outcome'] = np.dtype(np.uint8)
+COLUMNS['time'] = np.dtype(np.float64)
+
+SUFFIX = '.grid'
+META = 'meta.json'
+
+
+DTYPE = np.dtype(list(COLUMNS.items()))
+
+
+def table(columns):
+    """
+    Pack a dict of columns into one structured array.
+    """
+    t = np.ndarray(len(columns['outcome']), dtype=DTYPE)
+    for k in COLUMNS:
+        t[k] = columns[k]
+    return t
+
+
+def empty(n):
+    columns = {p: np.full(n, np.nan) for p in PARAMS}
+    columns['outcome'] = np.zeros(n, dtype=COLUMNS['outcome'])
+    columns['time'] = np.full(n, np.nan)
+    return columns
+
+
+class Record(object):
+    """
+    Row of `ColumnResults`, mimics the result records of `ParallelProcessor`.
+    """
+    __slots__ = ('_results', '_index')
+
+    def __init__(self, results, index):
+        self._results = results
+        self._index = index
+
+    def __getattr__(self, name):
+        if name in PARAMS:
+            x = self._results.columns[name][self._index]
+            if np.isnan(x):
+                return None
+            return x
+        raise AttributeError(name)
+
+    @property
+    def result(self):
+        return self._results.outcome(self._index)
+
+
+class ColumnResults(object):
+    """
+    Column-oriented replacement for the results list of a `Study`.
+
+    Unset parameters are stored as NaN.  If `outcomes` is given, the full
+    `Outcome` objects are returned, otherwise they are rebuilt from the
+    `outcome` and `time` columns.
+    """
+    def __init__(self, columns, outcomes=None):
+        self.columns = columns
+        self.outcomes = outcomes
+
+    def __len__(self):
+        return len(self.columns['outcome'])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Record(self, i)
+
+    @property
+    def results(self):
+        return list(self)
+
+    def result(self):
+        return [self.outcome(i) for i in range(len(self))]
+
+    def outcome(self, i):
+        if self.outcomes is not None:
+            return self.outcomes[i]
+        from quad import Outcome
+        return Outcome(
+            int(self.columns['outcome'][i]),
+            float(self.columns['time'][i]),
+            )
+
+    @classmethod
+    def from_results(cls, results):
+        """
+        Build columns from `ParallelProcessor` results in a single pass.
+        """
+        if isinstance(results, cls):
+            return results
+        from quad import Outcome
+        columns = empty(len(results))
+        outcomes = list()
+        for j, r in enumerate(results):
+            for p in PARAMS:
+                x = getattr(r, p, None)
+                if x is not None:
+                    columns[p][j] = x
+            o = r.result
+            if isinstance(o, tuple):
+                o = Outcome(*o)
+            columns['outcome'][j] = o.outcome
+            columns['time'][j] = o.time
+            outcomes.append(o)
+        return cls(columns, outcomes)
+
+    @classmethod
+    def from_points(cls, points, outcomes):
+        """
+        Build columns from a list of parameter dicts and their outcomes.
+        """
+        assert len(points) == len(outcomes)
+        columns = empty(len(points))
+        for j, (p, o) in enumerate(zip(points, outcomes)):
+            for k, x in p.items():
+                if k in PARAMS and x is not None:
+                    columns[k][j] = x
+            columns['outcome'][j] = o.outcome
+            columns['time'][j] = o.time
+        return cls(columns, list(outcomes))
+
+
+def read_archive(filename):
+    """
+    Unpickle an xz-compressed `Study` archive.
+
+    Old archives are migrated by `Study.__setstate__`.
+    """
+    with lzma.open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+def save(study, path, **meta):
+    """
+    Write the results of `study` as a columnar store at `path`.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    results = ColumnResults.from_results(study.results)
+    for k, d in COLUMNS.items():
+        np.save(path / f'{k}.npy', np.asarray(results.columns[k], dtype=d))
+    header = dict(
+        version = VERSION,
+        n = len(results),
+        columns = {k: d.str for k, d in COLUMNS.items()},
+        study = study.__class__.__name__,
+        study_version = getattr(study, 'version', None),
+        )
+    header.update(meta)
+    with open(path / META, 'wt') as f:
+        json.dump(header, f, indent=2)
+    return path
+
+
+def load(path, mmap_mode='r'):
+    """
+    Open the columnar store at `path`.
+
+    Returns `(columns, meta)`; columns are memory-mapped by default.
+    """
+    path = Path(path)
+    with open(path / META, 'rt') as f:
+        meta = json.load(f)
+    if meta['version'] > VERSION:
+        raise ValueError(f'Store version {meta["version"]} not supported.')
+    columns = {
+        k: np.load(path / f'{k}.npy', mmap_mode=mmap_mode)
+        for k in meta['columns']
+        }
+    return columns, meta
+
+
+def is_store(path):
+    return (Path(path) / META).is_file()
+
+
+def convert(filename, path=None):
+    """
+    Convert a pickled `.xz` archive into a columnar store.
+    """
+    filename = Path(filename)
+    if path is None:
+        path = filename.with_suffix(SUFFIX)
+    study = read_archive(filename)
+    return save(study, path, source=filename.name)
+
+
+if __name__ == '__main__':
+    for filename in sys.argv[1:]:
+        print(f' [convert] {filename} -> {convert(filename)}')
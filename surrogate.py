@@ -0,0 +1,275 @@
+"""
+Nearest-neighbour surrogate of `Quad` over archived studies.
+
+The archived outcomes are indexed by `dt` and by their parameters
+`q, an, en, i, pm, pb`, normalised by `SCALE`, in a bucket grid of cell
+size twice the `radius`, so the archived points within `radius` of a
+query are found in at most 64 buckets.  Phases are periodic.  A point is
+predicted only if at least `neighbours` archived points with the same
+`dt` lie within `radius` and all of them have the same fate.  Points
+already in the index are not added again.  A random `audit` fraction of
+the predicted points is integrated anyway and compared, as for
+`screen.Screen`:
+
+    surrogate = Surrogate.from_files(glob('*.xz'))
+    study = Study.sweep(surrogate=surrogate, en=..., an=..., dt=...)
+
+Predicted outcomes are marked `source='surrogate'`; the time of unstable
+outcomes is the median of the neighbours'.  `Study.sweep` adds the points
+it integrates to the index.  Build or extend an index on disk with
+
+    python surrogate.py -o surrogate.npz *.xz *.grid
+"""
+
+import sys
+import argparse
+import itertools
+from pathlib import Path
+
+import numpy as np
+
+import store
+from store import PARAMS
+from quad import Fate, Outcome, DEFAULTS
+
+VERSION = 10000
+
+AXES = tuple(p for p in PARAMS if p != 'dt')
+
+# parameter range mapped to unit length
+SCALE = dict(q=0.9, an=1., en=1., i=180., pm=360., pb=360.)
+
+PERIODIC = ('pm', 'pb')
+
+
+class Surrogate(object):
+    """
+    Predict the fate of points from archived outcomes within `radius`.
+    """
+    def __init__(self, radius=0.01, neighbours=8, audit=0.05, seed=0):
+        self.radius = radius
+        self.neighbours = neighbours
+        self.audit = audit
+        self.seed = seed
+        self.scale = np.array([SCALE[p] for p in AXES])
+        self.periodic = np.array([p in PERIODIC for p in AXES])
+        # periodic axes get a whole number of cells
+        self.ncell = np.where(self.periodic, np.maximum(1, np.floor(0.5 / radius)), 0).astype(int)
+        self.size = np.where(self.periodic, 1 / np.maximum(self.ncell, 1), 2 * radius)
+        # dt -> (x, outcome, time, buckets)
+        self.data = dict()
+        # dt -> normalised points in the index
+        self.known = dict()
+        self.sources = list()
+
+    def __len__(self):
+        return sum(len(d[1]) for d in self.data.values())
+
+    def normalize(self, x):
+        x = x / self.scale
+        x[:, self.periodic] %= 1
+        return x
+
+    def cells(self, x):
+        c = np.floor(x / self.size).astype(int)
+        return np.where(self.periodic, c % np.maximum(self.ncell, 1), c)
+
+    def add(self, table, source=None):
+        """
+        Add the rows of `table` (`Study.table` or a dict of columns).
+        """
+        x = np.stack([np.asarray(table[p], dtype=np.float64) for p in PARAMS], axis=-1)
+        for k, p in enumerate(PARAMS):
+            x[np.isnan(x[:, k]), k] = DEFAULTS[p]
+        outcome = np.asarray(table['outcome'], dtype=store.COLUMNS['outcome'])
+        time = np.asarray(table['time'], dtype=np.float64)
+        keep = outcome != Fate.FAIL
+        n = 0
+        for dt in np.unique(x[keep, -1]):
+            j = np.flatnonzero(keep & (x[:, -1] == dt))
+            y = self.normalize(x[j, :-1])
+            known = self.known.setdefault(dt, set())
+            new = np.ndarray(len(j), dtype=bool)
+            for k, c in enumerate(map(tuple, y)):
+                new[k] = c not in known
+                known.add(c)
+            j, y = j[new], y[new]
+            n += len(j)
+            if dt in self.data:
+                x0, o0, t0, buckets = self.data[dt]
+            else:
+                x0, o0, t0, buckets = np.ndarray((0, len(AXES))), outcome[:0], time[:0], dict()
+            for i, c in enumerate(map(tuple, self.cells(y)), len(x0)):
+                buckets.setdefault(c, list()).append(i)
+            self.data[dt] = (
+                np.concatenate((x0, y)),
+                np.concatenate((o0, outcome[j])),
+                np.concatenate((t0, time[j])),
+                buckets,
+                )
+        if source is not None:
+            self.sources.append(str(source))
+        print(f' [{self.__class__.__name__}] {n} points added, {len(self)} total')
+
+    def add_study(self, study, source=None):
+        self.add(study.table, source)
+
+    def add_file(self, filename):
+        """
+        Add an `.xz` archive or columnar store.
+        """
+        if store.is_store(filename):
+            columns, _ = store.load(filename)
+            self.add(columns, filename)
+        else:
+            self.add_study(store.read_archive(filename), filename)
+
+    @classmethod
+    def from_files(cls, filenames, **kwargs):
+        self = cls(**kwargs)
+        for filename in filenames:
+            self.add_file(filename)
+        return self
+
+    def nearby(self, point):
+        """
+        Fates and times of the archived points within `radius` of `point`.
+        """
+        p = {k: DEFAULTS[k] if (x := point.get(k)) is None else float(x) for k in PARAMS}
+        if p['dt'] not in self.data:
+            return np.zeros(0, dtype=store.COLUMNS['outcome']), np.zeros(0)
+        x, outcome, time, buckets = self.data[p['dt']]
+        y = self.normalize(np.array([[p[k] for k in AXES]]))
+        lo = self.cells(y - self.radius)[0]
+        hi = self.cells(y + self.radius)[0]
+        index = list()
+        for c in set(itertools.product(*zip(lo, hi))):
+            index.extend(buckets.get(c, ()))
+        if len(index) == 0:
+            return outcome[:0], time[:0]
+        index = np.array(index)
+        d = np.abs(x[index] - y)
+        d[:, self.periodic] = np.minimum(d[:, self.periodic], 1 - d[:, self.periodic])
+        index = index[np.sum(d**2, axis=-1) <= self.radius**2]
+        return outcome[index], time[index]
+
+    def query(self, point):
+        """
+        Most common fate near `point`, the fraction of neighbours with
+        that fate, and the number of neighbours; fate None if there are
+        none.
+        """
+        outcome, _ = self.nearby(point)
+        if len(outcome) == 0:
+            return None, 0., 0
+        fates, counts = np.unique(outcome, return_counts=True)
+        k = np.argmax(counts)
+        return int(fates[k]), counts[k] / len(outcome), len(outcome)
+
+    def predict(self, points):
+        """
+        Predicted outcomes of `points`, None where the neighbours are too
+        few or disagree.
+        """
+        outcomes = list()
+        for point in points:
+            outcome, time = self.nearby(point)
+            if len(outcome) < self.neighbours or np.any(outcome != outcome[0]):
+                outcomes.append(None)
+                continue
+            fate = int(outcome[0])
+            if fate == Fate.STABLE:
+                time = point.get('dt', DEFAULTS['dt'])
+            else:
+                time = float(np.median(time))
+            outcomes.append(Outcome(fate, time, source='surrogate'))
+        n = sum(o is not None for o in outcomes)
+        print(f' [{self.__class__.__name__}] {n} of {len(points)} points predicted')
+        return outcomes
+
+    def classify(self, points):
+        """
+        Predicted outcomes of `points` (None where unknown) and the indices
+        of predicted points to integrate for audit.
+        """
+        outcomes = self.predict(points)
+        predicted = [j for j, o in enumerate(outcomes) if o is not None]
+        rng = np.random.default_rng(self.seed)
+        naudit = int(np.ceil(self.audit * len(predicted)))
+        audit = sorted(rng.choice(predicted, naudit, replace=False).tolist())
+        print(f' [{self.__class__.__name__}] {len(audit)} predicted points audited')
+        return outcomes, audit
+
+    def report(self, predicted, integrated):
+        """
+        Compare predicted with integrated outcomes of the audit sample.
+        """
+        wrong = [(s, o) for s, o in zip(predicted, integrated) if s.outcome != o.outcome]
+        print(
+            f' [{self.__class__.__name__}] audit: {len(predicted) - len(wrong)} of '
+            f'{len(predicted)} predicted points confirmed')
+        for s, o in wrong:
+            print(f' [{self.__class__.__name__}] predicted {s!s}, integrated {o!s}')
+        return wrong
+
+    def save(self, filename):
+        x = list()
+        for dt, (y, outcome, time, _) in self.data.items():
+            y = y * self.scale
+            x.append((np.c_[y, np.full(len(y), dt)], outcome, time))
+        if len(x) == 0:
+            x = [(np.ndarray((0, len(PARAMS))), np.zeros(0, dtype=store.COLUMNS['outcome']), np.zeros(0))]
+        x, outcome, time = map(np.concatenate, zip(*x))
+        np.savez(
+            filename,
+            version = VERSION,
+            x = x,
+            outcome = outcome,
+            time = time,
+            radius = self.radius,
+            neighbours = self.neighbours,
+            sources = np.array(self.sources, dtype=str),
+            )
+
+    @classmethod
+    def load(cls, filename, **kwargs):
+        """
+        Load an index saved by `save`; `kwargs` override its `radius`
+        and `neighbours`.
+        """
+        with np.load(filename) as f:
+            if f['version'] > VERSION:
+                raise ValueError(f'Surrogate version {f["version"]} not supported.')
+            kwargs.setdefault('radius', float(f['radius']))
+            kwargs.setdefault('neighbours', int(f['neighbours']))
+            self = cls(**kwargs)
+            table = {p: f['x'][:, k] for k, p in enumerate(PARAMS)}
+            table['outcome'] = f['outcome']
+            table['time'] = f['time']
+            self.add(table)
+            self.sources = f['sources'].tolist()
+        return self
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or extend a surrogate index')
+    parser.add_argument('filenames', nargs='+', help='.xz archives or columnar stores')
+    parser.add_argument('-o', '--output', default='surrogate.npz')
+    parser.add_argument('-r', '--radius', type=float, default=None, help='in normalised units')
+    parser.add_argument('-k', '--neighbours', type=int, default=None, help='minimum number to predict')
+    args = parser.parse_args(argv)
+    kwargs = {k: x for k in ('radius', 'neighbours') if (x := getattr(args, k)) is not None}
+    if Path(args.output).exists():
+        surrogate = Surrogate.load(args.output, **kwargs)
+    else:
+        surrogate = Surrogate(**kwargs)
+    for filename in args.filenames:
+        if str(filename) in surrogate.sources:
+            print(f' [surrogate] {filename} already indexed')
+            continue
+        surrogate.add_file(filename)
+    surrogate.save(args.output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
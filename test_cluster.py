@@ -0,0 +1,150 @@
+"""
+Run `cluster.Coordinator` with several worker processes on localhost.
+
+    python -m pytest test_cluster.py
+"""
+
+import os
+import time
+import random
+import threading
+import multiprocessing
+
+import pytest
+
+import cluster
+
+AUTHKEY = b'test'
+
+
+class Task(object):
+    """
+    Stand-in for `Quad` that returns its tag and the point.
+
+    With `stall`, the first worker to get point 0 creates that file and
+    sleeps for `stall` seconds before returning.
+    """
+    def __init__(self, tag, delay=0.05, stall=None):
+        self.tag = tag
+        self.delay = delay
+        self.stall = stall
+
+    def __call__(self, j):
+        if j == 0 and self.stall is not None:
+            try:
+                os.close(os.open(self.stall, os.O_CREAT | os.O_EXCL))
+                time.sleep(10)
+            except FileExistsError:
+                pass
+        time.sleep(random.uniform(0, self.delay))
+        return (self.tag, j)
+
+    def key(self, j):
+        return j
+
+    def digest(self, j):
+        return f'{self.tag:02d}{j:06d}'
+
+
+class Coordinator(cluster.Coordinator):
+    """
+    Coordinator that counts the outcomes it accepts for each point.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accepted = list()
+
+    def finish(self, generation, j, outcome):
+        with self.lock:
+            if generation == self.generation and self.outcomes[j] is None:
+                self.accepted.append(j)
+            super().finish(generation, j, outcome)
+
+
+def start(coordinator, n):
+    workers = [
+        multiprocessing.Process(target=cluster.work, args=(coordinator.address, AUTHKEY), daemon=True)
+        for _ in range(n)]
+    for w in workers:
+        w.start()
+    return workers
+
+
+def test_consecutive_runs():
+    coordinator = cluster.Coordinator(('localhost', 0), authkey=AUTHKEY)
+    workers = start(coordinator, 4)
+    try:
+        for tag in range(3):
+            points = [dict(j=j) for j in range(20)]
+            outcomes = coordinator.run(Task(tag), points)
+            assert outcomes == [(tag, j) for j in range(20)]
+    finally:
+        coordinator.close()
+        for w in workers:
+            w.terminate()
+
+
+def test_authkey_required():
+    with pytest.raises(ValueError):
+        cluster.Coordinator(('localhost', 0), authkey=None)
+
+
+def test_worker_killed():
+    coordinator = Coordinator(('localhost', 0), authkey=AUTHKEY)
+    victim = start(coordinator, 1)
+    workers = list()
+    outcomes = list()
+    points = [dict(j=j) for j in range(20)]
+    thread = threading.Thread(target=lambda: outcomes.extend(coordinator.run(Task(0, delay=0.2), points)), daemon=True)
+    thread.start()
+    try:
+        # kill the only worker while it holds a lease
+        while len(coordinator.accepted) == 0 or len(coordinator.leases) == 0:
+            time.sleep(0.01)
+        victim[0].kill()
+        victim[0].join()
+        workers = start(coordinator, 3)
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+        assert outcomes == [(0, j) for j in range(20)]
+        assert sorted(coordinator.accepted) == list(range(20))
+    finally:
+        coordinator.close()
+        for w in victim + workers:
+            w.terminate()
+
+
+def test_timeout(tmp_path):
+    coordinator = Coordinator(('localhost', 0), authkey=AUTHKEY, timeout=0.5)
+    workers = start(coordinator, 2)
+    try:
+        points = [dict(j=j) for j in range(20)]
+        outcomes = coordinator.run(Task(0, stall=tmp_path / 'stall'), points)
+        assert (tmp_path / 'stall').exists()
+        assert outcomes == [(0, j) for j in range(20)]
+        assert sorted(coordinator.accepted) == list(range(20))
+    finally:
+        coordinator.close()
+        for w in workers:
+            w.terminate()
+
+
+def test_wrappers_record_on_coordinator(tmp_path):
+    pytest.importorskip('multistar')
+    from quad import dispatch
+    from cache import Cache
+    from checkpoint import Checkpoint
+    coordinator = cluster.Coordinator(('localhost', 0), authkey=AUTHKEY)
+    workers = start(coordinator, 2)
+    try:
+        task = Checkpoint(Cache(Task(0), tmp_path / 'cache'), tmp_path / 'ckpt')
+        points = [dict(j=j) for j in range(10)]
+        outcomes = dispatch(task, points, cluster=coordinator)
+        assert outcomes == [(0, j) for j in range(10)]
+        task = Checkpoint(Cache(Task(0), tmp_path / 'cache'), tmp_path / 'ckpt')
+        assert task.lookup(points) == outcomes
+        assert Cache(Task(0), tmp_path / 'cache').lookup(points) == outcomes
+    finally:
+        coordinator.close()
+        for w in workers:
+            w.terminate()